@@ -0,0 +1,122 @@
+"""Stand-ins shared by the tests, for the parts that need external binaries or a real source file."""
+from __future__ import annotations
+
+from threading import Event, Lock, Thread
+from time import sleep
+from typing import Any, Callable, List, Tuple
+from unittest import mock
+
+from vardautomation import FileInfo2, VPath
+
+from vsencode.codecs import X265Chunked
+
+__all__ = [
+    'FakeAudioTool', 'FakeProcess',
+    'audio_outputs', 'make_chunked_encoder', 'make_file', 'run_with_timeout'
+]
+
+# The FileInfo attribute every audio stage writes its files to, and what the files are called.
+audio_outputs = [('a_src', 'src'), ('a_src_cut', 'cut'), ('a_enc_cut', 'enc')]
+
+
+def make_file(workdir: VPath, name: str = 'ep01') -> FileInfo2:
+    """FileInfo2 with all its paths in the given directory, without indexing a source file."""
+    file = FileInfo2.__new__(FileInfo2)
+    file.name = file.work_filename = name
+    file.workdir = workdir
+    file.name_clip_output = workdir / f'{name}.265'
+    file.name_file_final = workdir / f'{name}.mkv'
+
+    for output, stage in audio_outputs:
+        setattr(file, output, workdir / f'{name}_{stage}_{{track_number}}.audio')
+
+    return file
+
+
+def make_chunked_encoder(workers: int = 2, chunk_size: int | None = None) -> X265Chunked:
+    """X265Chunked that runs without settings that need to be resolved from the clip."""
+    # The binary is only checked for on creation, so anything that exits right away will do.
+    with mock.patch.object(X265Chunked, '_vl_binary', 'true'):
+        encoder = X265Chunked(['-', '--y4m'], progress_update=None)
+
+    encoder.workers = workers
+    encoder.chunk_size = chunk_size
+    encoder.prefetch = 8
+
+    return encoder
+
+
+class FakeAudioTool:
+    """Stand-in for an audio extracter, cutter or encoder that writes its track's file."""
+
+    _lock = Lock()
+
+    def __init__(
+        self, file: Any, output: str, track: int, *,
+        log: List[Tuple[str, int]] | None = None, fail: bool = False, delay: float = 0
+    ) -> None:
+        self.file, self.output, self.track, self.track_out = file, output, track, [track]
+        self.log, self.fail, self.delay = log, fail, delay
+
+    def run(self) -> None:
+        if self.log is not None:
+            with self._lock:
+                self.log.append((self.output, self.track))
+
+        sleep(self.delay)
+
+        if self.fail:
+            raise RuntimeError(f"{self.output} failed on track {self.track}")
+
+        getattr(self.file, self.output).set_track(self.track).write_bytes(b'audio')
+
+
+class FakeProcess:
+    """Stand-in for an encoder's process that takes in the frames and writes the given output."""
+
+    def __init__(
+        self, output: VPath, returncode: int = 0, fail_after: int | None = None, cancel: Event | None = None
+    ) -> None:
+        self.output, self.returncode, self.fail_after, self.cancel = output, returncode, fail_after, cancel
+        self.stdin = self
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        if self.fail_after is not None and self.written >= self.fail_after:
+            raise BrokenPipeError("encoder crashed")
+
+        if self.cancel is not None:
+            self.cancel.set()
+
+        self.written += len(data)
+
+        return len(data)
+
+    def flush(self) -> None:
+        ...
+
+    def __enter__(self) -> FakeProcess:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.output.write_bytes(b'chunk')
+
+
+def run_with_timeout(func: Callable[[], Any], timeout: float = 10) -> BaseException | None:
+    """Run the function in a thread, and fail if it doesn't return in time (i.e. it hangs)."""
+    errors: List[BaseException] = []
+
+    def _target() -> None:
+        try:
+            func()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = Thread(target=_target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    if thread.is_alive():
+        raise AssertionError("Did not finish in time!")
+
+    return errors[0] if errors else None
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from typing import List, Tuple
+
+from vardautomation import VPath
+
+from fakes import FakeAudioTool, make_file, run_with_timeout
+from vsencode.audio import run_audio_pipeline, run_audio_tools
+
+_stages = ['a_src', 'a_src_cut', 'a_enc_cut']
+
+
+class _AudioToolsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file = make_file(VPath(self.tmp.name))
+        self.log: List[Tuple[str, int]] = []
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def _stage(self, stage: str, tracks: int, fail_on: int | None = None, delay: float = 0) -> List[FakeAudioTool]:
+        return [
+            FakeAudioTool(self.file, stage, i, log=self.log, fail=i == fail_on, delay=0 if i == fail_on else delay)
+            for i in range(tracks)
+        ]
+
+
+class TestRunAudioPipeline(_AudioToolsTest):
+    def test_every_track_goes_through_every_stage_in_order(self) -> None:
+        error = run_with_timeout(lambda: run_audio_pipeline(*(self._stage(stage, 5) for stage in _stages)))
+
+        self.assertIsNone(error)
+        self.assertCountEqual(self.log, [(stage, i) for stage in _stages for i in range(5)])
+
+        for stage in _stages:
+            self.assertEqual([i for s, i in self.log if s == stage], list(range(5)))
+
+        for i in range(5):
+            self.assertLess(self.log.index(('a_src', i)), self.log.index(('a_src_cut', i)))
+            self.assertLess(self.log.index(('a_src_cut', i)), self.log.index(('a_enc_cut', i)))
+
+    def test_empty_stages_are_skipped(self) -> None:
+        self.assertIsNone(run_with_timeout(lambda: run_audio_pipeline([], self._stage('a_src_cut', 2), [])))
+        self.assertEqual(self.log, [('a_src_cut', 0), ('a_src_cut', 1)])
+
+        self.assertIsNone(run_with_timeout(lambda: run_audio_pipeline([], [], [])))
+
+    def test_mismatched_stages(self) -> None:
+        with self.assertRaises(ValueError):
+            run_audio_pipeline(self._stage('a_src', 2), self._stage('a_src_cut', 3), [])
+
+    def test_failure_propagates_and_terminates(self) -> None:
+        for failing in _stages:
+            with self.subTest(failing=failing):
+                self.log.clear()
+
+                stages = [self._stage(s, 6, 2 if s == failing else None) for s in _stages]
+                error = run_with_timeout(lambda: run_audio_pipeline(*stages))
+
+                self.assertIsInstance(error, RuntimeError)
+                self.assertEqual(str(error), f"{failing} failed on track 2")
+
+                # The failed track never reaches the next stages.
+                later = _stages[_stages.index(failing) + 1:]
+                self.assertFalse(any((stage, 2) in self.log for stage in later))
+
+
+class TestRunAudioTools(_AudioToolsTest):
+    def test_every_tool_runs(self) -> None:
+        self.assertIsNone(run_with_timeout(lambda: run_audio_tools(self._stage('a_enc_cut', 8), max_workers=3)))
+        self.assertCountEqual(self.log, [('a_enc_cut', i) for i in range(8)])
+        self.assertTrue(all(self.file.a_enc_cut.set_track(i).exists() for i in range(8)))
+
+    def test_no_tools(self) -> None:
+        self.assertIsNone(run_with_timeout(lambda: run_audio_tools([])))
+
+    def test_failure_propagates(self) -> None:
+        tools = self._stage('a_enc_cut', 4, fail_on=0, delay=0.5)
+
+        error = run_with_timeout(lambda: run_audio_tools(tools, max_workers=1))
+
+        self.assertIsInstance(error, RuntimeError)
+        # Only one tool runs at a time, so the remaining tools get dropped long before the worker is free again.
+        self.assertNotIn(('a_enc_cut', 2), self.log)
+        self.assertNotIn(('a_enc_cut', 3), self.log)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from threading import Event, Lock
+from types import SimpleNamespace
+from typing import Any, List, Tuple
+from unittest import mock
+
+from vardautomation import VPath
+from vstools import vs
+
+from fakes import FakeProcess, make_chunked_encoder, make_file
+from vsencode.codecs import ChunkedEncoder, X265Chunked, _ChunkCancelled, get_chunk_ranges
+
+# The class `ChunkedEncoder` hands off to through `super()`, i.e. the actual encoder.
+_parent = X265Chunked.__mro__[X265Chunked.__mro__.index(ChunkedEncoder) + 1]
+
+
+class TestChunkRanges(unittest.TestCase):
+    def test_even_split(self) -> None:
+        self.assertEqual(get_chunk_ranges(100, 4), [(0, 25), (25, 50), (50, 75), (75, 100)])
+
+    def test_uneven_split(self) -> None:
+        self.assertEqual(get_chunk_ranges(10, 3), [(0, 4), (4, 8), (8, 10)])
+
+    def test_more_chunks_than_frames(self) -> None:
+        self.assertEqual(get_chunk_ranges(3, 5), [(0, 1), (1, 2), (2, 3)])
+
+    def test_ranges_cover_every_frame_once(self) -> None:
+        for num_frames, chunks in [(1, 1), (7, 2), (1000, 7), (34046, 12)]:
+            ranges = get_chunk_ranges(num_frames, chunks)
+
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], num_frames)
+            self.assertTrue(all(a[1] == b[0] for a, b in zip(ranges, ranges[1:])))
+            self.assertLessEqual(len(ranges), chunks)
+
+
+class TestChunkedRunEnc(unittest.TestCase):
+    def setUp(self) -> None:
+        self.file = SimpleNamespace(name_clip_output=VPath('/encodes/ep01.265'))
+        self.clip = SimpleNamespace(num_frames=100)
+
+    def test_chunk_output_naming(self) -> None:
+        encoder = make_chunked_encoder(workers=2, chunk_size=30)
+
+        with mock.patch.object(X265Chunked, '_chunk_key', side_effect=lambda clip, file, rng, qp: f'key{rng[0]}'), \
+                mock.patch.object(X265Chunked, '_encode_chunk') as encode_chunk, \
+                mock.patch('vsencode.codecs.join_chunks') as join:
+            encoder.run_enc(self.clip, self.file)
+
+        expected = [
+            VPath('/encodes/ep01_chunk000_key0.265'), VPath('/encodes/ep01_chunk001_key25.265'),
+            VPath('/encodes/ep01_chunk002_key50.265'), VPath('/encodes/ep01_chunk003_key75.265'),
+        ]
+
+        self.assertCountEqual([c.args[3] for c in encode_chunk.call_args_list], expected)
+        join.assert_called_once_with(expected, self.file.name_clip_output)
+
+    def test_fallback_to_single_encode(self) -> None:
+        qp_clip = object()
+
+        cases: List[Tuple[int, Any]] = [
+            (1, self.file),
+            (2, SimpleNamespace(name_clip_output=VPath('/encodes/ep01.mkv'))),
+            (2, None),
+        ]
+
+        for workers, file in cases:
+            with self.subTest(workers=workers, file=file), \
+                    mock.patch.object(_parent, 'run_enc', autospec=True) as run_enc, \
+                    mock.patch.object(X265Chunked, '_encode_chunk') as encode_chunk:
+                encoder = make_chunked_encoder(workers)
+                encoder.run_enc(self.clip, file, qpfile_clip=qp_clip)
+
+                run_enc.assert_called_once_with(encoder, self.clip, file, qpfile_clip=qp_clip)
+                encode_chunk.assert_not_called()
+
+    def test_failing_chunk_cancels_the_rest(self) -> None:
+        encoder = make_chunked_encoder(workers=2, chunk_size=25)
+        started: List[Tuple[int, int]] = []
+        lock = Lock()
+
+        def _encode_chunk(
+            clip: Any, file: Any, frame_range: Tuple[int, int], output: VPath, *, cancel: Event, **kwargs: Any
+        ) -> None:
+            with lock:
+                started.append(frame_range)
+
+            if frame_range[0] == 0:
+                raise RuntimeError("encoder crashed")
+
+            # Every other chunk runs until it gets cancelled.
+            self.assertTrue(cancel.wait(10))
+            raise _ChunkCancelled
+
+        with mock.patch.object(X265Chunked, '_chunk_key', return_value='key'), \
+                mock.patch.object(X265Chunked, '_encode_chunk', side_effect=_encode_chunk), \
+                mock.patch('vsencode.codecs.join_chunks') as join:
+            with self.assertRaisesRegex(RuntimeError, "encoder crashed"):
+                encoder.run_enc(self.clip, self.file)
+
+        join.assert_not_called()
+        # Both workers are busy until the failure is noticed, so the final chunk never gets started.
+        self.assertNotIn((75, 100), started)
+
+
+class TestChunkKey(unittest.TestCase):
+    def setUp(self) -> None:
+        self.file = SimpleNamespace(name_clip_output=VPath('/encodes/ep01.265'))
+        self.clip = vs.core.std.BlankClip(length=100, color=[16, 128, 128], format=vs.YUV420P8)
+
+    def _key(
+        self, clip: vs.VideoNode, frame_range: Tuple[int, int] = (0, 50),
+        settings_key: str = 'settings', qpfile_clip: vs.VideoNode | None = None
+    ) -> str:
+        encoder = make_chunked_encoder()
+        encoder._settings_key = settings_key
+
+        # Stand-in for the encoder's settings, which also change along with the output path.
+        def _set_variable(enc: Any) -> Any:
+            return {'frames': enc.clip.num_frames, 'thread': enc._thread_share, 'clip_output': str(enc.file)}
+
+        with mock.patch.object(_parent, 'set_variable', autospec=True, side_effect=_set_variable):
+            return encoder._chunk_key(clip, self.file, frame_range, qpfile_clip)
+
+    def test_key_is_stable(self) -> None:
+        same = vs.core.std.BlankClip(length=100, color=[16, 128, 128], format=vs.YUV420P8)
+
+        self.assertEqual(self._key(self.clip), self._key(self.clip))
+        self.assertEqual(self._key(self.clip), self._key(same))
+
+    def test_key_ignores_output_path(self) -> None:
+        key = self._key(self.clip)
+        self.file = SimpleNamespace(name_clip_output=VPath('/elsewhere/ep01.265'))
+
+        self.assertEqual(self._key(self.clip), key)
+
+    def test_key_changes_with_the_filtering(self) -> None:
+        brighter = self.clip.std.Expr(['x 1 +', ''])
+
+        self.assertNotEqual(self._key(self.clip), self._key(brighter))
+
+    def test_key_changes_with_the_trims(self) -> None:
+        black = vs.core.std.BlankClip(self.clip)
+        white = vs.core.std.BlankClip(self.clip, color=[235, 128, 128])
+
+        self.assertNotEqual(self._key(black[:20] + white[:80]), self._key(black[:30] + white[:70]))
+
+    def test_key_changes_with_the_settings(self) -> None:
+        self.assertNotEqual(self._key(self.clip), self._key(self.clip, settings_key='other settings'))
+        self.assertNotEqual(self._key(self.clip), self._key(self.clip, qpfile_clip=self.clip))
+
+    def test_key_changes_with_the_range(self) -> None:
+        self.assertNotEqual(self._key(self.clip, (0, 50)), self._key(self.clip, (50, 100)))
+
+
+class TestEncodeChunk(unittest.TestCase):
+    """Runs vardautomation's actual encoding chain, with only the encoder's process faked."""
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file = make_file(VPath(self.tmp.name))
+        self.output = self.file.name_clip_output.append_stem('_chunk000_key')
+        self.clip = vs.core.std.BlankClip(length=10, width=64, height=48, format=vs.YUV420P8)
+        self.encoder = make_chunked_encoder()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def _encode_chunk(self, cancel: Event | None = None, **process_kwargs: Any) -> mock.Mock:
+        cancel = cancel or Event()
+        process = FakeProcess(self.output.append_stem('_partial'), **process_kwargs)
+
+        with mock.patch('subprocess.Popen', return_value=process) as popen:
+            self.encoder._encode_chunk(self.clip, self.file, (2, 6), self.output, cancel=cancel)
+
+        return popen
+
+    def test_finished_chunk_is_renamed(self) -> None:
+        with mock.patch('vsencode.codecs.get_encoder_cores', return_value=8):
+            popen = self._encode_chunk()
+
+        # Each of the two encoders only gets half of the threads.
+        self.assertEqual(popen.call_args.args[0], ['true', '-', '--y4m', '--pools', '4'])
+        self.assertEqual(self.output.read_bytes(), b'chunk')
+        self.assertFalse(self.output.append_stem('_partial').exists())
+
+    def test_failed_encoder_is_discarded(self) -> None:
+        # vardautomation catches the errors itself, and doesn't check the exit code at all.
+        for kwargs in ({'returncode': 1}, {'fail_after': 0}):
+            with self.subTest(**kwargs):
+                with self.assertRaisesRegex(RuntimeError, "Encoding frames 2-5 failed"):
+                    self._encode_chunk(**kwargs)
+
+                self.assertFalse(self.output.exists())
+                self.assertFalse(self.output.append_stem('_partial').exists())
+
+    def test_cancelled_chunk_is_discarded(self) -> None:
+        cancel = Event()
+
+        # Another chunk fails as soon as this one has started.
+        with self.assertRaises(_ChunkCancelled):
+            self._encode_chunk(cancel, cancel=cancel)
+
+        self.assertFalse(self.output.exists())
+        self.assertFalse(self.output.append_stem('_partial').exists())
+
+    def test_existing_chunk_is_skipped(self) -> None:
+        self.output.write_bytes(b'done')
+
+        popen = self._encode_chunk()
+
+        popen.assert_not_called()
+        self.assertEqual(self.output.read_bytes(), b'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from typing import Any, List, Sequence, Set
+from unittest import mock
+
+from vardautomation import SelfRunner, VPath
+
+from fakes import FakeAudioTool, audio_outputs, make_file
+from vsencode.encoder import EncodeRunner
+from vsencode.runner import SetupStep
+
+
+class TestRunWorkFiles(unittest.TestCase):
+    """Runs the audio through vardautomation's actual SelfRunner, with the video already encoded."""
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workdir = VPath(self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def _make_runner(self) -> EncodeRunner:
+        file = make_file(self.workdir)
+
+        # Skip the constructor, which wants a real clip and project setup.
+        runner = EncodeRunner.__new__(EncodeRunner)
+        runner.setup_steps = dict.fromkeys(SetupStep, True)
+        runner.file = file
+        runner.clip = runner.v_encoder = runner.l_encoder = None
+        runner.qp_clip = runner.post_lossless = None
+
+        runner.a_extracters, runner.a_cutters, runner.a_encoders = (
+            [FakeAudioTool(file, output, i) for i in range(2)] for output, _ in audio_outputs
+        )
+        runner.a_work_files = [getattr(file, output).set_track(i) for output, _ in audio_outputs for i in range(2)]
+
+        def _mux(*args: Any) -> Set[VPath]:
+            file.name_file_final.write_bytes(b'mkv')
+            return set()
+
+        runner.muxer = mock.Mock()
+        runner.muxer.mux.side_effect = _mux
+
+        return runner
+
+    def _run(self, a_parallel: bool = False, existing: Sequence[str] = (), **run_kwargs: Any) -> Set[VPath]:
+        runners: List[SelfRunner] = []
+
+        def _self_runner(*args: Any) -> SelfRunner:
+            runners.append(SelfRunner(*args))
+            return runners[-1]
+
+        for path in self.workdir.iterdir():
+            path.unlink()
+
+        # The video's already encoded, so SelfRunner only takes care of the audio and the muxing.
+        (self.workdir / 'ep01.265').write_bytes(b'video')
+
+        # An existing file, like an external audio file, must never be cleaned up.
+        for name in ('ep01_src_0.audio', *existing):
+            (self.workdir / name).write_bytes(b'source')
+
+        with mock.patch('vsencode.encoder.SelfRunner', side_effect=_self_runner):
+            runner = self._make_runner()
+            runner.a_parallel = a_parallel
+            runner.run(clean_up=False, **run_kwargs)
+
+        # SelfRunner also registers paths for tracks that don't exist, which can't be cleaned up either way.
+        return {VPath(path) for path in runners[0].work_files if path.exists()}
+
+    def test_every_run_registers_the_same_work_files(self) -> None:
+        # FileInfo2 extracts and cuts the audio by itself, so only the encoded audio is made by the run.
+        expected = {self.workdir / name for name in ['ep01.265', 'ep01_enc_0.audio', 'ep01_enc_1.audio']}
+
+        self.assertEqual(self._run(), expected)
+        self.assertEqual(self._run(order='audio'), expected)
+        self.assertEqual(self._run(parallel_av=True), expected)
+        self.assertEqual(self._run(order='parallel'), expected)
+        self.assertEqual(self._run(a_parallel=True), expected)
+
+    def test_split_audio_skips_finished_tracks(self) -> None:
+        # Same as SelfRunner does when it runs the audio itself.
+        for run_kwargs in ({'parallel_av': True}, {'a_parallel': True}):
+            with self.subTest(**run_kwargs):
+                self._run(existing=['ep01_enc_1.audio'], **run_kwargs)
+
+                self.assertEqual((self.workdir / 'ep01_enc_0.audio').read_bytes(), b'audio')
+                self.assertEqual((self.workdir / 'ep01_enc_1.audio').read_bytes(), b'source')
+                self.assertFalse((self.workdir / 'ep01_cut_0.audio').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,20 +10,107 @@
 
 # flake8: noqa
 
-from vardautomation import VPath
-from vardautomation.language import *
-
-from . import encoder, exceptions, generate, helpers, presets, templates, types, util
-from .encoder import *
-from .exceptions import *
-from .generate import *
-from .helpers import FileInfo
-from .presets import *
-from .templates import *
-from .types import *
-from .util import *
-
-# Aliases
-load_video = FileInfo
-src = FileInfo
-source = FileInfo
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Dict, List
+
+__all__ = [
+    # Submodules
+    'encoder', 'exceptions', 'generate', 'helpers', 'presets', 'templates', 'types', 'util',
+    # vardautomation
+    'VPath',
+    # encoder
+    'EncodeRunner',
+    # exceptions
+    'AlreadyInChainError', 'EncoderTypeError', 'FrameLengthMismatch', 'MissingDependenciesError',
+    'NoAudioEncoderError', 'NoChaptersError', 'NoLosslessVideoEncoderError', 'NotEnoughValuesError',
+    'NotInChainError', 'NoVideoEncoderError',
+    # generate
+    'IniSetup',
+    # helpers
+    'FileInfo',
+    # presets
+    'encode', 'x264_aac_preset', 'x264_flac_preset', 'x265_aac_preset', 'x265_flac_preset',
+    # templates
+    'qaac_template', 'x264_defaults', 'x265_defaults',
+    'ARABIC', 'CHINESE', 'DUTCH', 'ENGLISH', 'FRENCH', 'GERMAN', 'HEBREW', 'HINDI', 'INDONESIAN', 'ITALIAN',
+    'JAPANESE', 'KOREAN', 'Lang', 'POLISH', 'PORTUGUESE', 'SPANISH', 'TAMIL', 'TURKISH', 'UNDEFINED',
+    # types
+    'AUDIO_CODEC', 'EncodersEnum', 'FilePath', 'LOSSLESS_VIDEO_ENCODER', 'VIDEO_CODEC',
+    # util
+    'get_shader', 'get_timecodes_path', 'get_vs_core',
+    # Aliases
+    'load_video', 'src', 'source',
+]
+
+# Everything is loaded on first access, so importing a single submodule doesn't pull in the entire package.
+_submodules: List[str] = ['encoder', 'exceptions', 'generate', 'helpers', 'presets', 'templates', 'types', 'util']
+
+_aliases: Dict[str, str] = {'load_video': 'FileInfo', 'src': 'FileInfo', 'source': 'FileInfo'}
+
+_name_locations: Dict[str, str] = {
+    'VPath': 'vardautomation',
+    'EncodeRunner': '.encoder',
+    **dict.fromkeys([
+        'AlreadyInChainError', 'EncoderTypeError', 'FrameLengthMismatch', 'MissingDependenciesError',
+        'NoAudioEncoderError', 'NoChaptersError', 'NoLosslessVideoEncoderError', 'NotEnoughValuesError',
+        'NotInChainError', 'NoVideoEncoderError',
+    ], '.exceptions'),
+    'IniSetup': '.generate',
+    'FileInfo': '.helpers',
+    **dict.fromkeys([
+        'encode', 'x264_aac_preset', 'x264_flac_preset', 'x265_aac_preset', 'x265_flac_preset'
+    ], '.presets'),
+    **dict.fromkeys(['qaac_template', 'x264_defaults', 'x265_defaults'], '.templates'),
+    **dict.fromkeys([
+        'ARABIC', 'CHINESE', 'DUTCH', 'ENGLISH', 'FRENCH', 'GERMAN', 'HEBREW', 'HINDI', 'INDONESIAN', 'ITALIAN',
+        'JAPANESE', 'KOREAN', 'Lang', 'POLISH', 'PORTUGUESE', 'SPANISH', 'TAMIL', 'TURKISH', 'UNDEFINED',
+    ], '.templates'),
+    **dict.fromkeys(['AUDIO_CODEC', 'EncodersEnum', 'FilePath', 'LOSSLESS_VIDEO_ENCODER', 'VIDEO_CODEC'], '.types'),
+    **dict.fromkeys(['get_shader', 'get_timecodes_path', 'get_vs_core'], '.util'),
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _submodules:
+        attr = import_module(f'.{name}', __name__)
+    elif (target := _aliases.get(name, name)) in _name_locations:
+        attr = getattr(import_module(_name_locations[target], __name__), target)
+    elif not name.startswith('__'):
+        # Any other language vardautomation knows about remains available from here.
+        try:
+            attr = getattr(import_module('vardautomation.language'), name)
+        except AttributeError:
+            raise AttributeError(f"module '{__name__}' has no attribute '{name}'") from None
+    else:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+    globals()[name] = attr
+
+    return attr
+
+
+def __dir__() -> List[str]:
+    return sorted({*globals(), *__all__})
+
+
+if TYPE_CHECKING:
+    from vardautomation import VPath
+
+    from . import encoder, exceptions, generate, helpers, presets, templates, types, util
+    from .encoder import EncodeRunner
+    from .exceptions import (AlreadyInChainError, EncoderTypeError, FrameLengthMismatch, MissingDependenciesError,
+                             NoAudioEncoderError, NoChaptersError, NoLosslessVideoEncoderError, NotEnoughValuesError,
+                             NotInChainError, NoVideoEncoderError)
+    from .generate import IniSetup
+    from .helpers import FileInfo
+    from .presets import encode, x264_aac_preset, x264_flac_preset, x265_aac_preset, x265_flac_preset
+    from .templates import (ARABIC, CHINESE, DUTCH, ENGLISH, FRENCH, GERMAN, HEBREW, HINDI, INDONESIAN, ITALIAN,
+                            JAPANESE, KOREAN, POLISH, PORTUGUESE, SPANISH, TAMIL, TURKISH, UNDEFINED, Lang,
+                            qaac_template, x264_defaults, x265_defaults)
+    from .types import AUDIO_CODEC, LOSSLESS_VIDEO_ENCODER, VIDEO_CODEC, EncodersEnum, FilePath
+    from .util import get_shader, get_timecodes_path, get_vs_core
+
+    # Aliases
+    load_video = FileInfo
+    src = FileInfo
+    source = FileInfo
@@ -2,10 +2,14 @@ from __future__ import annotations
 
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from fractions import Fraction
-from typing import Any, List, Sequence, Tuple, Type
+from functools import cache, lru_cache
+from itertools import chain, islice, repeat
+from queue import Queue
+from threading import Thread
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Sequence, Tuple, Type
 
-from pymediainfo import MediaInfo
 from vardautomation import (JAPANESE, AudioCutter, AudioEncoder, AudioExtracter, AudioTrack, DuplicateFrame,
                             Eac3toAudioExtracter, FDKAACEncoder, FileInfo, FileInfo2, Lang, Preset, QAACEncoder,
                             SoxCutter, Trim, VPath, logger)
@@ -14,6 +18,9 @@ from vstools import FrameRangeN, normalize_ranges, vs
 from .exceptions import MissingDependenciesError
 from .types import PresetBackup
 
+if TYPE_CHECKING:
+    from pymediainfo import MediaInfo
+
 
 def resolve_ap_trims(trims: FrameRangeN | List[FrameRangeN] | None, clip: vs.VideoNode) -> List[List[FrameRangeN]]:
     """Convert list[tuple] into list[list] (begna pls)."""
@@ -28,10 +35,12 @@ def set_eafile_properties(
     trims: List[Trim | DuplicateFrame] | Trim | None = None, use_ap: bool = True
 ) -> FileInfo2:
     """Set the external audio file properties."""
-    file_obj.path = VPath(external_audio_file)
-    file_obj.a_src = VPath(external_audio_file)
-    file_obj.path_without_ext = VPath(os.path.splitext(external_audio_file)[0])
-    file_obj.work_filename = file_obj.path.stem
+    ea_path = VPath(external_audio_file)
+
+    file_obj.path = ea_path
+    file_obj.a_src = ea_path
+    file_obj.path_without_ext = ea_path.with_suffix('')
+    file_obj.work_filename = ea_path.stem
 
     if external_audio_clip:
         file_obj.clip = external_audio_clip
@@ -42,54 +51,91 @@ def set_eafile_properties(
     return file_obj
 
 
-def get_track_info(obj: FileInfo2 | str, all_tracks: bool = False) -> Tuple[List[int], List[str]]:
-    """Try to retrieve the channels and original codecs of an audio track."""
-    track_channels = list[int]()
-    original_codecs = list[str]()
-    media_info: MediaInfo
+@lru_cache(maxsize=256)
+def _parse_media_info(path: str, mtime_ns: int, size: int) -> MediaInfo:
+    # mtime and size are only part of the cache key, so a file that gets rewritten is parsed again.
+    # We only need the stream headers, so skip the full container scan and sequence detection.
+    # `full` must stay enabled, as we rely on the machine-readable `channel_s` values.
+    from pymediainfo import MediaInfo
+
+    parsed = MediaInfo.parse(path, parse_speed=0.0, mediainfo_options={'File_TestContinuousFileNames': '0'})
+
+    return MediaInfo(parsed) if isinstance(parsed, str) else parsed
+
+
+def _get_media_info(path: str) -> MediaInfo:
+    stat = os.stat(path)
+
+    return _parse_media_info(path, stat.st_mtime_ns, stat.st_size)
+
+
+def clear_media_info_cache() -> None:
+    """Clear the cached MediaInfo objects, e.g. after muxing to a file that was probed before."""
+    _parse_media_info.cache_clear()
+
+
+def get_track_info(
+    obj: FileInfo2 | str, all_tracks: bool = False, media_info: MediaInfo | None = None
+) -> Tuple[List[int], List[str]]:
+    """
+    Try to retrieve the channels and original codecs of an audio track.
 
+    :param media_info:      MediaInfo of the file, if it was already parsed. If None, parses the file.
+    """
     if isinstance(obj, str):
-        parsed = MediaInfo.parse(obj)
-        media_info = MediaInfo(parsed) if isinstance(parsed, str) else parsed
+        path_name = obj
     elif isinstance(obj, (FileInfo, FileInfo2)):
-        media_info = obj.media_info
+        path_name = obj.path.to_str()
     else:
         raise ValueError("Obj is not a FileInfo/FileInfo2 object or a path!")
 
-    path_name = obj.path if isinstance(obj, FileInfo2) else obj
+    # FileInfo.media_info parses the file again on every access, so always go through the cache instead.
+    if media_info is None:
+        media_info = _get_media_info(path_name)
 
     logger.info("Checking track info...")
-    for i, track in enumerate(media_info.tracks, start=1):
-        if track.track_type == 'Audio':
-            track_channels += [track.channel_s]
-            original_codecs += [track.format]
+    track_iter = ((i, t) for i, t in enumerate(media_info.tracks, start=1) if t.track_type == 'Audio')
+    audio_tracks = list(track_iter if all_tracks else islice(track_iter, 1))
 
-            logger.warning(f"{path_name} track {i}: {track.format} (Channels: {track.channel_s})")
+    track_channels = [track.channel_s for _, track in audio_tracks]
+    original_codecs = [track.format for _, track in audio_tracks]
 
-            if not all_tracks:
-                break
+    if audio_tracks:
+        logger.warning('\n'.join(
+            f"{path_name} track {i}: {track.format} (Channels: {track.channel_s})" for i, track in audio_tracks
+        ))
 
     return track_channels, original_codecs
 
 
+@cache
+def _get_video_source() -> Callable[..., List[str]]:
+    # bvsfunc pulls in a lot on import, so only load it once AudioProcessor is actually used.
+    # TODO Annoy begna for this: https://github.com/begna112/bvsfunc/issues/16
+    try:
+        from bvsfunc.util.AudioProcessor import video_source
+    except ImportError:
+        raise ModuleNotFoundError("audio.run_ap: missing dependency 'bvsfunc'!")
+
+    return video_source
+
+
 def run_ap(
     file_obj: FileInfo2, is_aac: bool = True,
     trims: FrameRangeN | List[FrameRangeN] | None = None,
     fps: Fraction | None = None, **enc_overrides: Any
 ) -> List[str]:
     """Run bvsfunc.AudioProcessor."""
-    # TODO Annoy begna for this: https://github.com/begna112/bvsfunc/issues/16
-    try:
-        from bvsfunc.util.AudioProcessor import video_source
-    except ImportError:
-        raise ModuleNotFoundError("audio.run_ap: missing dependency 'bvsfunc'!")
+    video_source = _get_video_source()
+
+    assert file_obj.a_src_cut
 
     if 'silent' not in enc_overrides:
         enc_overrides |= {'silent': False}
 
     return video_source(
-        in_file=file_obj.path.to_str(),
-        out_file=str(file_obj.a_src_cut),
+        in_file=os.fspath(file_obj.path),
+        out_file=os.fspath(file_obj.a_src_cut),
         trim_list=resolve_ap_trims(trims, file_obj.clip),
         trims_framerate=fps or file_obj.clip.fps,
         frames_total=file_obj.clip.num_frames,
@@ -97,33 +143,41 @@ def run_ap(
     )
 
 
+@cache
+def _which(name: str) -> str | None:
+    return shutil.which(name)
+
+
+def refresh_tool_cache() -> None:
+    """Clear the cached executable lookups, e.g. after changing PATH."""
+    _which.cache_clear()
+
+
 def check_qaac_installed() -> bool:
     """Check if qaac is installed."""
-    b32 = shutil.which('qaac') is not None
-    b64 = shutil.which('qaac64') is not None
+    b32 = _which('qaac') is not None
+    b64 = _which('qaac64') is not None
 
     return b32 or b64
 
 
 def check_ffmpeg_installed() -> bool:
     """Check if ffmpeg is installed."""
-    return shutil.which('ffmpeg') is not None
+    return _which('ffmpeg') is not None
 
 
 def check_aac_encoders_installed() -> None:
     """Check if all aac encoders are installed."""
-    try:
-        qaac_ins = check_qaac_installed()
-    except MissingDependenciesError:
-        logger.warning("qaac not installed!")
+    # Only one of them is needed, so don't look for ffmpeg if qaac is already available.
+    if check_qaac_installed():
+        return
 
-    try:
-        ffmpeg_ins = check_ffmpeg_installed()
-    except MissingDependenciesError:
-        logger.warning("ffmpeg not installed!")
+    logger.warning("qaac not installed!")
 
-    if not any([qaac_ins, ffmpeg_ins]):
-        raise MissingDependenciesError("", message="Neither qaac nor ffmpeg are installed!")
+    if check_ffmpeg_installed():
+        return
+
+    raise MissingDependenciesError("", message="Neither qaac nor ffmpeg are installed!")
 
 
 def iterate_ap_audio_files(
@@ -140,40 +194,36 @@ def iterate_ap_audio_files(
     else:
         xml_args = [None]  # type:ignore[list-item]
 
-    if (diff := len(audio_files) - len(xml_args)):
-        xml_args.extend(xml_args[-1:] * diff)
-
     if not track_channels:
         track_channels = [2] * len(audio_files)
 
-    if len(lang) < len(track_channels):
-        lang_old = lang.copy()
-        lang.extend([lang[-1]] * (len(track_channels) - len(lang)))
+    if (diff := len(track_channels) - len(lang)) > 0:
         logger.warning(
             "Less languages passed than channels available! Extending the final entry.\n"
-            f"Old langs: {lang_old}\n"
-            f"New langs: {lang}"
+            f"Old langs: {lang}\n"
+            f"New langs: {lang + [lang[-1]] * diff}"
         )
 
-    a_tracks = list[AudioTrack]()
+    if not all_tracks:
+        audio_files, track_channels = audio_files[:1], track_channels[:1]
+
+    labels = [_codec_layout_label(codec, channels) for channels in track_channels]
 
     # TODO: Fix mypy complaining about arg_type. Can't pass anything to tid because that breaks shit
     # https://discord.com/channels/856381934052704266/856406641872207903/993925364281786399
     # The code still seems to work fine, though.
-    zipped = zip(audio_files, track_channels, xml_args, lang)
-    for i, (track, channels, xml_arg, tlang) in enumerate(zipped, start=0):
-        xml_arg = xml_arg if xml_arg is not None else {}
-
-        a_tracks += [
-            AudioTrack(
-                VPath(track).format(track_number=str(i)),
-                f'{codec.upper()} {get_channel_layout_str(channels)}', tlang, i, *xml_arg
-            )
-        ]
+    # Pad the xml args and languages by repeating their final entry. zip stops at the audio files.
+    zipped = zip(audio_files, labels, chain(xml_args, repeat(xml_args[-1])), chain(lang, repeat(lang[-1])))
+    # AudioProcessor returns the final filenames, so these only rarely still need the track number formatted in.
+    a_tracks = [
+        AudioTrack(
+            VPath(track.format(track_number=str(i)) if '{track_number' in track else track),
+            label, tlang, i, *(xml_arg or ())
+        ) for i, (track, label, xml_arg, tlang) in enumerate(zipped)
+    ]
 
-        logger.warning(f"{audio_files[i-1]}: Added audio track ({track}, {channels})")
-        if not all_tracks:
-            break
+    for track, channels in zip(audio_files, track_channels):
+        logger.warning(f"Added audio track: {track} (Channels: {channels})")
 
     return a_tracks
 
@@ -181,6 +231,15 @@ def iterate_ap_audio_files(
 no_track_warning: str = "There must be at least one audio track in your file!"
 
 
+@lru_cache
+def _ensure_track_template(path: VPath) -> VPath:
+    # Insert the track number template right before the extension, unless the path already has one.
+    if "{track_number:s}" in os.fspath(path):
+        return path
+
+    return path.with_stem(path.stem + "_track_{track_number:s}")
+
+
 def iterate_cutter(
     file_obj: FileInfo2, cutter: Type[AudioCutter] = SoxCutter,
     tracks: int = 1, out_path: VPath | None = None,
@@ -191,10 +250,7 @@ def iterate_cutter(
         raise ValueError(no_track_warning)
 
     if file_obj.a_src_cut is None and out_path:
-        if r"{track_number:s}" not in str(file_obj.a_src_cut):
-            og_path = os.path.splitext(out_path)
-            out_path = VPath(og_path[0] + r"_track_{track_number:s}" + og_path[1])
-        file_obj.a_src_cut = out_path
+        file_obj.a_src_cut = _ensure_track_template(out_path)
 
     return [cutter(file_obj, track=i, **overrides) for i in range(tracks)]
 
@@ -210,12 +266,9 @@ def iterate_encoder(
         raise ValueError(no_track_warning)
 
     if file_obj.a_enc_cut is None and out_path:
-        if r"track_number:s" not in str(file_obj.a_enc_cut):
-            og_path = os.path.splitext(out_path)
-            out_path = VPath(og_path[0] + r"_track_\{track_number:s\}" + og_path[1])
-        file_obj.a_enc_cut = out_path
+        file_obj.a_enc_cut = _ensure_track_template(out_path)
 
-    if not isinstance(xml_file, Sequence):
+    if xml_file is None or isinstance(xml_file, str):
         xml_file = [xml_file] * tracks
 
     if encoder in (QAACEncoder, FDKAACEncoder):
@@ -233,10 +286,7 @@ def iterate_extractors(
         raise ValueError(no_track_warning)
 
     if file_obj.a_src_cut is None and out_path:
-        if r"{track_number:s}" not in str(file_obj.a_src_cut):
-            og_path = os.path.splitext(out_path)
-            out_path = VPath(og_path[0] + r"_track_{track_number:s}" + og_path[1])
-        file_obj.a_src_cut = out_path
+        file_obj.a_src_cut = _ensure_track_template(out_path)
 
     return [extractor(file_obj, track_in=i, track_out=i, **overrides) for i in range(tracks)]  # type: ignore
 
@@ -250,61 +300,216 @@ def iterate_tracks(
         raise ValueError(no_track_warning)
 
     if file_obj.a_enc_cut is None and out_path:
-        if r"{track_number:s}" not in str(file_obj.a_enc_cut):
-            og_path = os.path.splitext(out_path)
-            out_path = VPath(og_path[0] + r"_track_{track_number:s}" + og_path[1])
-        file_obj.a_enc_cut = out_path
+        file_obj.a_enc_cut = _ensure_track_template(out_path)
 
     assert file_obj.a_enc_cut
 
-    if not isinstance(codecs, Sequence):
+    # Strings are Sequences too, so check for those explicitly.
+    if codecs is None or isinstance(codecs, str):
         codecs = [codecs] * tracks
 
     assert len(codecs) == tracks, 'You need to specify codecs for all tracks!'
 
+    # Only stringify the template once, rather than once per track through VPath.format.
+    template = file_obj.a_enc_cut.to_str()
+    fmt_args = {'work_filename': file_obj.work_filename}
+
     return [
-        AudioTrack(file_obj.a_enc_cut.format(work_filename=file_obj.work_filename, track_number=str(i)),
-                   codec, lang) for i, codec in enumerate(codecs)
+        AudioTrack(VPath(template.format_map(fmt_args | {'track_number': str(i)})), codec, lang)
+        for i, codec in enumerate(codecs)
     ]
 
 
+def iterate_audio_setup(
+    file_obj: FileInfo2, tracks: int = 1, codecs: str | Sequence[str | None] | None = None,
+    extractor: Type[AudioExtracter] = Eac3toAudioExtracter, cutter: Type[AudioCutter] = SoxCutter,
+    lang: Lang = JAPANESE, extract_overrides: Dict[str, Any] | None = None,
+    cutter_overrides: Dict[str, Any] | None = None
+) -> Tuple[List[AudioExtracter], List[AudioCutter], List[AudioTrack]]:
+    """
+    Set up the extractor, cutter and track for every audio track in a single pass.
+
+    This is the same as calling ``iterate_extractors``, ``iterate_cutter`` and ``iterate_tracks`` in turn,
+    except every track is only visited once.
+    The overrides accept the same ``extractor``, ``cutter`` and ``out_path`` keys as those functions.
+    """
+    if tracks < 1:
+        raise ValueError(no_track_warning)
+
+    # Take out the keys the separate iterate_* functions consume themselves, rather than pass them to the tools.
+    extract_overrides, cutter_overrides = dict(extract_overrides or {}), dict(cutter_overrides or {})
+    extractor = extract_overrides.pop('extractor', extractor)
+    cutter = cutter_overrides.pop('cutter', cutter)
+
+    # Extracting comes first, so its output path takes precedence, same as calling the functions in turn.
+    for out_path in (extract_overrides.pop('out_path', None), cutter_overrides.pop('out_path', None)):
+        if file_obj.a_src_cut is None and out_path:
+            file_obj.a_src_cut = _ensure_track_template(VPath(out_path))
+
+    assert file_obj.a_enc_cut
+
+    if codecs is None or isinstance(codecs, str):
+        codecs = [codecs] * tracks
+
+    assert len(codecs) == tracks, 'You need to specify codecs for all tracks!'
+
+    template = file_obj.a_enc_cut.to_str()
+    fmt_args = {'work_filename': file_obj.work_filename}
+
+    extracters = list[AudioExtracter]()
+    cutters = list[AudioCutter]()
+    audio_tracks = list[AudioTrack]()
+
+    for i, codec in enumerate(codecs):
+        extracters.append(extractor(file_obj, track_in=i, track_out=i, **extract_overrides))  # type: ignore
+        cutters.append(cutter(file_obj, track=i, **cutter_overrides))
+        audio_tracks.append(AudioTrack(VPath(template.format_map(fmt_args | {'track_number': str(i)})), codec, lang))
+
+    return extracters, cutters, audio_tracks
+
+
+def run_audio_tools(
+    tools: Sequence[AudioExtracter | AudioCutter | AudioEncoder], max_workers: int | None = None
+) -> None:
+    """
+    Run the given audio tools for every track concurrently.
+
+    Every tool spawns its own external process (eac3to, sox, qaac, ffmpeg...) for a single track,
+    so tracks don't depend on one another and can be processed at the same time.
+    Tools should all belong to the same stage, e.g. the output of ``iterate_extractors``.
+
+    :param tools:           Audio extracters, cutters or encoders to run.
+    :param max_workers:     Maximum amount of tools running at once.
+                            Defaults to half the available threads, as encoders are CPU-bound.
+    """
+    if not tools:
+        return
+
+    if max_workers is None:
+        max_workers = max(1, min(len(tools), (os.cpu_count() or 2) // 2))
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        futures = [pool.submit(tool.run) for tool in tools]
+
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # Don't start any of the remaining tools once one has failed.
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def run_audio_pipeline(
+    extracters: Sequence[AudioExtracter], cutters: Sequence[AudioCutter], encoders: Sequence[AudioEncoder]
+) -> None:
+    """
+    Run the extract, cut and encode stages of every track as a pipeline.
+
+    Every stage runs in its own thread, so a track can be cut while the next track is still being extracted.
+    Each stage must hold exactly one tool per track, or none at all if the stage should be skipped.
+
+    :param extracters:      Audio extracters, e.g. the output of ``iterate_extractors``.
+    :param cutters:         Audio cutters, e.g. the output of ``iterate_cutter``.
+    :param encoders:        Audio encoders, e.g. the output of ``iterate_encoder``.
+    """
+    stages = [list(tools) for tools in (extracters, cutters, encoders) if tools]
+
+    if not stages:
+        return
+
+    if len({len(tools) for tools in stages}) > 1:
+        raise ValueError("run_audio_pipeline: 'Every stage must have the same amount of tracks!'")
+
+    # Bounded queues between stages, so a fast stage can't run too far ahead of a slow one.
+    queues: List[Queue[int | None]] = [Queue(maxsize=0 if i == 0 else 2) for i in range(len(stages))]
+    errors = list[BaseException]()
+
+    for i in range(len(stages[0])):
+        queues[0].put(i)
+    queues[0].put(None)
+
+    outboxes = [*queues[1:], None]
+    threads = [
+        Thread(target=_run_pipeline_stage, args=(tools, inbox, outbox, errors))
+        for tools, inbox, outbox in zip(stages, queues, outboxes)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        for thread in threads:
+            thread.join()
+    except BaseException as e:
+        # E.g. Ctrl+C. The stages finish the tool they're running, but don't start on any other tracks.
+        errors.append(e)
+        raise
+
+    if errors:
+        raise errors[0]
+
+
+def _run_pipeline_stage(
+    tools: List[AudioExtracter | AudioCutter | AudioEncoder],
+    inbox: Queue[int | None], outbox: Queue[int | None] | None, errors: List[BaseException]
+) -> None:
+    try:
+        while (track := inbox.get()) is not None:
+            # Once any stage has failed, keep draining the queue so the stages upstream don't block.
+            if errors:
+                continue
+
+            try:
+                tools[track].run()
+            except BaseException as e:
+                errors.append(e)
+                continue
+
+            if outbox is not None:
+                outbox.put(track)
+    finally:
+        # Always pass on the sentinel, so the next stage is guaranteed to stop too.
+        if outbox is not None:
+            outbox.put(None)
+
+
 def set_missing_tracks(file_obj: FileInfo2, preset: Preset = PresetBackup, use_ap: bool = True) -> FileInfo2:
     """Set missing tracks in the given FileInfo object."""
-    try:
-        assert isinstance(file_obj.a_src, VPath)
-    except AssertionError:
-        logger.info(f"Set missing track a_src_cut (\"{file_obj.a_src}\" -> \"{file_obj.a_src}\")...")
+    if not isinstance(file_obj.a_src, VPath):
+        logger.info(f"Set missing track a_src (\"{file_obj.a_src}\" -> \"{preset.a_src}\")...")
         file_obj.a_src = preset.a_src
 
     if use_ap:
-        try:
-            assert file_obj.a_src_cut == file_obj.name
-        except AssertionError:
+        if file_obj.a_src_cut != file_obj.name:
             logger.info(f"Set missing track a_src_cut (\"{file_obj.a_src_cut}\" -> \"{file_obj.name}\")...")
             file_obj.a_src_cut = VPath(file_obj.name)
-    else:
-        try:
-            assert isinstance(file_obj.a_src_cut, VPath)
-        except AssertionError:
-            logger.info(f"Set missing track a_src_cut (\"{file_obj.a_src_cut}\" -> \"{preset.a_src_cut}\")...")
-            file_obj.a_src_cut = preset.a_src_cut
+    elif not isinstance(file_obj.a_src_cut, VPath):
+        logger.info(f"Set missing track a_src_cut (\"{file_obj.a_src_cut}\" -> \"{preset.a_src_cut}\")...")
+        file_obj.a_src_cut = preset.a_src_cut
 
-    try:
-        assert isinstance(file_obj.a_enc_cut, VPath)
-    except AssertionError:
+    if not isinstance(file_obj.a_enc_cut, VPath):
         logger.info(f"Set missing track a_enc_cut (\"{file_obj.a_enc_cut}\" -> \"{preset.a_enc_cut}\")...")
         file_obj.a_enc_cut = preset.a_enc_cut
 
     return file_obj
 
 
+# Basic mapping of channel counts to their most common layout.
+channel_layout_map: Dict[int, str] = {1: '1.0', 2: '2.0', 5: '5.1', 6: '5.1', 7: '7.1'}
+
+
+@lru_cache(maxsize=32)
+def _codec_layout_label(codec: str, channels: int) -> str:
+    # Tracks usually share a codec and layout, so every track can reuse the same label.
+    return f'{codec.upper()} {get_channel_layout_str(channels)}'
+
+
 # TODO: Make this a proper function that accurately gets the channel layout.
 #       Improving this function should be a priority!!!
 def get_channel_layout_str(channels: int) -> str:
     """Return a very basic channel layout picker for audio tracks."""
-    match channels:
-        case 2: return '2.0'
-        case 5 | 6: return '5.1'
-        case 1: return '1.0'
-        case 7: return '7.1'
-        case _: raise ValueError(f"get_channel_layout_str: 'Current channel count ({channels}) unsupported!'")
+    try:
+        return channel_layout_map[channels]
+    except KeyError:
+        raise ValueError(f"get_channel_layout_str: 'Current channel count ({channels}) unsupported!'")
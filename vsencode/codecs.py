@@ -1,13 +1,29 @@
 from __future__ import annotations
 
-from typing import Any
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
+from copy import copy
+from functools import partial
+from threading import Event
+from typing import Any, BinaryIO, Callable, Dict, List, Sequence, Tuple, cast
 
-from vardautomation import X264, X265
-from vstools import get_prop
+from vardautomation import X264, X265, FileInfo, VideoLanEncoder, VPath, logger
+from vstools import get_prop, vs
 
 from .helpers import get_encoder_cores, get_lookahead, get_sar, get_range, get_color_range
 
-__all__ = ['X264Custom', 'X265Custom']
+__all__ = ['X264Custom', 'X265Custom', 'X264Chunked', 'X265Chunked']
+
+# Raw bitstreams can simply be appended to one another, as every chunk starts with its own headers and an IDR frame.
+elementary_stream_exts = ['.264', '.h264', '.avc', '.265', '.h265', '.hevc']
+
+# Large enough to keep an SSD saturated while joining chunks, instead of the default 64 KiB.
+_COPY_BUFSIZE = 16 << 20
 
 
 class X264Custom(X264):
@@ -33,17 +49,36 @@ class X264Custom(X264):
     :key transfer:          Automatically determine the clip's gamma transfer from the clip's frameprops. (s)
     """
 
+    # Variables for the last clip and file they were generated for.
+    _variables: Tuple[vs.VideoNode, object, Dict[str, Any]] | None = None
+
     def set_variable(self) -> Any:
         """Set a custom variable."""
-        sar = get_sar(self.clip)
+        # This gets called for every encode, but only changes alongside the clip and output file.
+        if self._variables is not None:
+            clip, file, variables = self._variables
+
+            if clip is self.clip and file is self.file:
+                return variables
+
+        with self.clip.get_frame(0) as frame:
+            props = frame.props
+
+            sar = get_sar(props)
 
-        return super().set_variable() | {
-            'lookahead': get_lookahead(self.clip),
-            'range': get_range(self.clip),
-            'sarden': sar[0],
-            'sarnum': sar[1],
-            'thread': get_encoder_cores(),
-        }
+            # The parent returns a fresh dict every call, so it's safe to add our keys to it directly.
+            variables = super().set_variable()
+            variables.update(
+                lookahead=get_lookahead(self.clip),
+                range=get_range(props),
+                sarden=sar[0],
+                sarnum=sar[1],
+                thread=get_encoder_cores(),
+            )
+
+        self._variables = (self.clip, self.file, variables)
+
+        return variables
 
 
 class X265Custom(X265):
@@ -60,7 +95,8 @@ class X265Custom(X265):
 
     :key chromaloc:         Automatically determine the clip's chroma location from the clip's frameprops. (d)
     :key crops:             Automatically determine the clip's display-window from the clip's frameprops. (s)
-                            This will enable cropping in realtime and automatically add "--overscan crop" too.
+                            This will enable cropping in realtime and automatically add "--overscan crop" too,
+                            unless the clip isn't cropped at all.
                             Expected to be a string following this pattern: "<left>,<top>,<right>,<bottom>".
                             Custom frameprop is "_crops". Only use for anamorphic resolutions. Experimental.
     :key lookahead:         Automatically determine the lookahead based on the framerate of the video. (d)
@@ -74,19 +110,286 @@ class X265Custom(X265):
     :key transfer:          Automatically determine the clip's gamma transfer from the clip's frameprops. (d)
     """
 
+    # Variables for the last clip and file they were generated for.
+    _variables: Tuple[vs.VideoNode, object, Dict[str, Any]] | None = None
+
+    def set_variable(self) -> Any:
+        """Set a custom variable."""
+        # This gets called for every encode, but only changes alongside the clip and output file.
+        if self._variables is not None:
+            clip, file, variables = self._variables
+
+            if clip is self.clip and file is self.file:
+                return variables
+
+        # Every prop lookup on the clip requests frame 0 again, so only request it once.
+        with self.clip.get_frame(0) as frame:
+            props = frame.props
+
+            sar = get_sar(props)
+            min_luma, max_luma = get_color_range(self.clip, self.params, props)
+
+            # Don't signal overscan cropping for an empty display window.
+            crops = get_prop(props, '_crops', str, default='0,0,0,0')
+            crops = crops if crops == '0,0,0,0' else f"{crops} --overscan crop"
+
+            variables = super().set_variable()
+            variables.update(
+                chromaloc=get_prop(props, '_ChromaLocation', int),
+                crops=crops,
+                lookahead=get_lookahead(self.clip),
+                range=get_range(props),
+                sarden=sar[0],
+                sarnum=sar[1],
+                thread=get_encoder_cores(),
+                min_luma=min_luma,
+                max_luma=max_luma,
+            )
+
+        self._variables = (self.clip, self.file, variables)
+
+        return variables
+
+
+class _ChunkCancelled(Exception):
+    """Raised to stop a chunk's encode once another chunk has failed."""
+
+
+class ChunkedEncoder(VideoLanEncoder):
+    """
+    Encoder that splits the clip into chunks and encodes several of them at the same time.
+
+    x264 and x265 scale poorly past a certain amount of threads,
+    so multiple smaller encoders make better use of CPUs with a lot of cores.
+    Every chunk encoder gets an even share of the threads and prefetch,
+    and the chunks are joined back together once they're all done.
+
+    Only raw elementary stream outputs can be joined. Any other output is encoded in a single go.
+
+    :attr workers:          Amount of chunks to encode at once.
+    :attr chunk_size:       Maximum length of a chunk in frames. If None, splits the clip into `workers` chunks.
+                            Smaller chunks are picked up by whichever encoder is free next,
+                            so one slow chunk can't hold up the entire encode while the other encoders sit idle.
+    """
+
+    workers: int = 1
+    chunk_size: int | None = None
+
+    # Amount of encoders this one is sharing the threads with.
+    _thread_share: int = 1
+
+    # Exit code of the last encode, or None if it never finished.
+    _returncode: int | None = None
+
+    # Encoder option that caps the amount of threads, so every chunk's encoder only uses its share of them.
+    _thread_option: str | None = None
+
+    def __init__(self, settings: Any, /, *args: Any, **kwargs: Any) -> None:
+        super().__init__(settings, *args, **kwargs)
+
+        if isinstance(settings, (str, os.PathLike)):
+            settings = VPath(settings).read_text()
+
+        # Everything besides the clip that the params get resolved from, for the chunk keys. Callbacks don't count.
+        self._settings_key = repr([settings, args, sorted((k, v) for k, v in kwargs.items() if not callable(v))])
+
     def set_variable(self) -> Any:
         """Set a custom variable."""
-        sar = get_sar(self.clip)
-        min_luma, max_luma = get_color_range(self.clip, self.params)
-
-        return super().set_variable() | {
-            'chromaloc': get_prop(self.clip, '_ChromaLocation', int),
-            'crops': f"{get_prop(self.clip, '_crops', str, default='0,0,0,0')} --overscan crop",
-            'lookahead': get_lookahead(self.clip),
-            'range': get_range(self.clip),
-            'sarden': sar[0],
-            'sarnum': sar[1],
-            'thread': get_encoder_cores(),
-            'min_luma': min_luma,
-            'max_luma': max_luma,
-        }
+        variables = super().set_variable()
+
+        if self._thread_share < 2:
+            return variables
+
+        return variables | {'thread': max(1, variables['thread'] // self._thread_share)}
+
+    def run_enc(
+        self, clip: vs.VideoNode, file: FileInfo | None, *,
+        qpfile_clip: vs.VideoNode | None = None, qpfile_func: Callable[..., Any] | None = None
+    ) -> None:
+        """Encode the clip, in chunks if possible."""
+        # Only pass on a qp file function if one was given, so the encoder's own default is used otherwise.
+        qpfile_kwargs: Dict[str, Any] = {} if qpfile_func is None else {'qpfile_func': qpfile_func}
+
+        if self.workers < 2 or file is None or file.name_clip_output.suffix.lower() not in elementary_stream_exts:
+            return super().run_enc(clip, file, qpfile_clip=qpfile_clip, **qpfile_kwargs)
+
+        chunks = self.workers
+
+        if self.chunk_size:
+            chunks = max(chunks, math.ceil(clip.num_frames / self.chunk_size))
+
+        ranges = get_chunk_ranges(clip.num_frames, chunks)
+        # Chunks are named after everything that affects their output, so finished chunks can be reused when resuming.
+        keys = [self._chunk_key(clip, file, frame_range, qpfile_clip) for frame_range in ranges]
+        outputs = [file.name_clip_output.append_stem(f'_chunk{i:03d}_{key}') for i, key in enumerate(keys)]
+
+        cancel = Event()
+        encode_chunk = partial(self._encode_chunk, clip, file, cancel=cancel, qpfile_clip=qpfile_clip, **qpfile_kwargs)
+
+        # All chunks are queued up front, and every encoder takes the next one as soon as it's done with its last.
+        executor = ThreadPoolExecutor(self.workers)
+
+        try:
+            for future in as_completed([executor.submit(encode_chunk, *args) for args in zip(ranges, outputs)]):
+                future.result()
+        except BaseException:
+            # Don't wait on hours of encoding that gets thrown away: drop the queued chunks and stop the running ones.
+            executor.shutdown(wait=False, cancel_futures=True)
+            cancel.set()
+            raise
+        finally:
+            executor.shutdown()
+
+        join_chunks(outputs, file.name_clip_output)
+
+    def _do_encode(self) -> None:
+        # Same as the parent's, except it keeps the exit code so a chunk that failed is never used.
+        logger.info(f'{type(self).__name__} command: ' + ' '.join(self.params))
+
+        with logger.catch_ctx(), subprocess.Popen(self.params, stdin=subprocess.PIPE) as process:
+            self.clip.output(cast(BinaryIO, process.stdin), self.y4m, self.progress_update, self.prefetch, self.backlog)
+
+        self._returncode = process.returncode
+
+    def _chunk_key(
+        self, clip: vs.VideoNode, file: FileInfo, frame_range: Tuple[int, int], qpfile_clip: vs.VideoNode | None = None
+    ) -> str:
+        start, end = frame_range
+        chunk = clip[start:end]
+
+        # Resolve the settings the same way the chunk's encoder will, minus the output path the key ends up in.
+        encoder = copy(self)
+        encoder.clip, encoder.file, encoder._thread_share = chunk, file, self.workers
+
+        variables = sorted((k, v) for k, v in encoder.set_variable().items() if k != 'clip_output')
+
+        # The filtering and trims can change without changing anything else about the clip, so check the frames too.
+        key = [
+            self._settings_key, variables, frame_range, clip.num_frames, _frame_fingerprint(chunk),
+            qpfile_clip is not None
+        ]
+
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+
+    def _encode_chunk(
+        self, clip: vs.VideoNode, file: FileInfo, frame_range: Tuple[int, int], output: VPath,
+        *, cancel: Event, qpfile_clip: vs.VideoNode | None = None, **qpfile_kwargs: Any
+    ) -> None:
+        if cancel.is_set():
+            raise _ChunkCancelled
+
+        if output.exists():
+            logger.info(f"Found already encoded chunk {output.name}! Skipping...")
+            return
+
+        encoder = copy(self)
+
+        # Don't share any mutable state (like the params) with the other chunks' encoders.
+        vars(encoder).update({k: copy(v) for k, v in vars(self).items() if isinstance(v, (list, dict))})
+
+        encoder._thread_share = self.workers
+
+        # Added last, so it takes precedence over whatever the settings use.
+        if self._thread_option:
+            encoder.params += [self._thread_option, str(max(1, get_encoder_cores() // self.workers))]
+        encoder.prefetch = max(1, self.prefetch // self.workers) if self.prefetch else self.prefetch
+        # Resuming splits the output into parts named after the file, which would clash between chunks.
+        encoder.resumable = False
+
+        # Only rename the chunk once it's done, so an interrupted chunk is never mistaken for a finished one.
+        chunk_file = copy(file)
+        chunk_file.name_clip_output = output.append_stem('_partial')
+
+        start, end = frame_range
+
+        # Cutting the qp clip along with the clip keeps the scene changes' frame numbers relative to the chunk.
+        # The qp file is named after the chunk's output, and removed by the encoder once it's done.
+        if qpfile_clip is not None:
+            qpfile_clip = qpfile_clip[start:end]
+
+        update = encoder.progress_update
+        cancelled = False
+        frames_done = 0
+
+        def _progress_update(current: int, total: int) -> None:
+            nonlocal cancelled, frames_done
+
+            # Once the frames stop coming in, the encoder finishes up and exits by itself.
+            if cancel.is_set():
+                cancelled = True
+                raise _ChunkCancelled
+
+            frames_done = current
+
+            if update is not None:
+                update(current, total)
+
+        encoder.progress_update = _progress_update
+        encoder._returncode = None
+
+        try:
+            super(ChunkedEncoder, encoder).run_enc(
+                clip[start:end], chunk_file, qpfile_clip=qpfile_clip, **qpfile_kwargs
+            )
+        except SystemExit:
+            # vardautomation logs any error during the encode and exits, which would only take down this thread.
+            pass
+
+        # vardautomation doesn't check the encoder's exit code either, so a crashed encoder leaves a truncated chunk.
+        if cancelled or encoder._returncode != 0 or frames_done != end - start:
+            with suppress(FileNotFoundError):
+                os.remove(chunk_file.name_clip_output)
+
+            if cancelled:
+                raise _ChunkCancelled
+
+            raise RuntimeError(
+                f"{type(self).__name__}: 'Encoding frames {start}-{end - 1} failed! "
+                f"(exit code: {encoder._returncode}, frames: {frames_done}/{end - start})'"
+            )
+
+        os.replace(chunk_file.name_clip_output, output)
+
+
+class X264Chunked(ChunkedEncoder, X264Custom):
+    """Chunked version of `X264Custom`. See `ChunkedEncoder` for more information."""
+
+    _thread_option = '--threads'
+
+
+class X265Chunked(ChunkedEncoder, X265Custom):
+    """Chunked version of `X265Custom`. See `ChunkedEncoder` for more information."""
+
+    _thread_option = '--pools'
+
+
+def _frame_fingerprint(clip: vs.VideoNode) -> str:
+    # The first, middle and last frame catch changes to the filtering or trims, for the cost of rendering three frames.
+    assert clip.format
+
+    digest = hashlib.sha1()
+
+    for n in sorted({0, clip.num_frames // 2, clip.num_frames - 1}):
+        with clip.get_frame(n) as frame:
+            for plane in range(clip.format.num_planes):
+                digest.update(frame[plane].tobytes())
+
+    return digest.hexdigest()
+
+
+def get_chunk_ranges(num_frames: int, chunks: int) -> List[Tuple[int, int]]:
+    """Split the given amount of frames into (start, end) ranges of (nearly) equal size."""
+    size = max(1, math.ceil(num_frames / chunks))
+
+    return [(start, min(start + size, num_frames)) for start in range(0, num_frames, size)]
+
+
+def join_chunks(chunks: Sequence[VPath], output: VPath) -> None:
+    """Append the chunks to one another in order, and remove them afterwards."""
+    with open(output, 'wb') as out:
+        for chunk in chunks:
+            with open(chunk, 'rb') as f:
+                shutil.copyfileobj(f, out, _COPY_BUFSIZE)
+
+    for chunk in chunks:
+        os.remove(chunk)
@@ -3,11 +3,18 @@ from __future__ import annotations
 import os
 import re
 import shutil
-from typing import List
-
-from vardautomation import MatroskaFile, RunnerConfig, SelfRunner, Track, VideoTrack, VPath, logger, patch
+import subprocess
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import Any, Callable, List, Sequence, Tuple
+
+from vardautomation import (AudioCutter, AudioEncoder, AudioExtracter, FileInfo2, MatroskaFile, RunnerConfig,
+                            SelfRunner, Track, VideoTrack, VPath, logger, patch)
 from vstools import FrameRangeN
 
+from .audio import run_audio_pipeline, run_audio_tools
 from .helpers import verify_file_exists
 from .runner import AudioRunner, ChaptersRunner, SetupStep, VideoRunner
 from .util import get_timecodes_path
@@ -16,6 +23,57 @@ __all__ = ['EncodeRunner']
 
 common_idx_ext = ['lwi', 'ffindex']
 
+# FICLONE ioctl request from linux/fs.h.
+_FICLONE = 0x40049409
+
+
+def _clone_file(src: os.PathLike[str] | str, dst: os.PathLike[str] | str) -> None:
+    """Copy a file, using an instant copy-on-write clone where the filesystem supports it (btrfs, XFS...)."""
+    if sys.platform == 'linux':
+        import fcntl
+
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass
+
+            # Keeps the data in the kernel, and lets network filesystems copy it server-side.
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+
+                while remaining > 0 and (copied := os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30)):
+                    remaining -= copied
+
+                return
+            except OSError:
+                pass
+
+    # Lets the kernel do the copying (sendfile, fcopyfile, CopyFileW) and skips copying the permission bits.
+    shutil.copyfile(src, dst)
+
+
+def _remove_files(paths: Sequence[os.PathLike[str] | str], max_workers: int = 8) -> List[OSError | None]:
+    """
+    Remove the given files concurrently, so slow (network) filesystems don't stall on every file in turn.
+
+    Returns the error raised for every file, or None if it was removed.
+    """
+    def _remove(path: os.PathLike[str] | str) -> OSError | None:
+        try:
+            os.remove(path)
+        except OSError as e:
+            return e
+
+        return None
+
+    if not paths:
+        return []
+
+    with ThreadPoolExecutor(min(max_workers, len(paths))) as executor:
+        return list(executor.map(_remove, paths))
+
 
 class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
     """
@@ -77,9 +135,13 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
             logger.info(f"Credit set in video metadata: \"{encoder_credit}\"...")
 
         # Adding all the tracks
-        all_tracks: List[Track] = [
-            VideoTrack(self.file.name_clip_output, encoder_credit, self.v_lang), *self.a_tracks, *self.c_tracks
-        ]
+        all_tracks: List[Track] = [VideoTrack(self.file.name_clip_output, encoder_credit, self.v_lang)]
+
+        if self.audio_setup:
+            all_tracks.extend(self.a_tracks)
+
+        if self.chapters_setup:
+            all_tracks.extend(self.c_tracks)
 
         self.muxer = MatroskaFile(self.file.name_file_final.absolute(), all_tracks, '--ui-language', 'en')
 
@@ -89,14 +151,17 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
         elif timecodes is None:
             tc_path = get_timecodes_path()
             if tc_path.exists():
-                self.muxer.add_timestamps(get_timecodes_path())
+                self.muxer.add_timestamps(tc_path)
                 logger.info(f"Found timecode file at {tc_path}! Muxing in...")
 
         self.muxing_setup = True
+        self.setup_steps[SetupStep.MUXING] = True
 
         return self
 
-    def run(self, /, clean_up: bool = True, order: str = 'video', *, deep_clean: bool = False) -> None:
+    def run(
+        self, /, clean_up: bool = True, order: str = 'video', *, deep_clean: bool = False, parallel_av: bool = False
+    ) -> None:
         """
         Set up the relevant settings for the runner and run the automation.
 
@@ -105,29 +170,46 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
         :param clean_up:        Clean up files after the encoding is done. Default: True.
         :param order:           Order to encode the video and audio in.
                                 Setting it to "video" will first encode the video, and vice versa.
+                                Setting it to "parallel" is the same as setting `parallel_av`.
                                 This does not affect anything if AudioProcessor is used.
         :param deep_clean:      Clean all common related project files. Default: False.
+        :param parallel_av:     Encode the audio at the same time as the video, and mux once both are done.
+                                Ignores `order`. Falls back to the regular run if `post_lossless` is set.
+                                Default: False.
         """
         logger.success("Preparing to run encode...")
 
         self.check_in_chain(SetupStep.VIDEO, True)
 
-        cwd = self.file.workdir
-        for part in re.findall(self.file.name + "_part_[0-9]{1,3}", '\n'.join(os.listdir())):
-            try:
-                if os.stat(f"{cwd}/{part}").st_size == 0:
-                    os.remove(f"{cwd}/{part}")
-            except (FileNotFoundError, PermissionError):
-                ...
+        # Remove empty parts left behind by an interrupted resumable encode, listing the workdir only once.
+        part_pattern = re.compile(re.escape(self.file.name) + "_part_[0-9]{1,3}")
+
+        with os.scandir(self.file.workdir) as entries:
+            for entry in entries:
+                if not part_pattern.match(entry.name):
+                    continue
 
+                try:
+                    if entry.stat().st_size == 0:
+                        os.remove(entry.path)
+                except (FileNotFoundError, PermissionError):
+                    ...
+
+        # Only the audio files made by this run are work files. Anything already there (like an external file) is kept.
+        audio_work_files = [path for path in self.a_work_files if not path.exists()]
+
+        parallel_av = (parallel_av or order.lower() == 'parallel') and self.post_lossless is None
+        split_audio = (parallel_av or self.a_parallel) and any([self.a_extracters, self.a_cutters, self.a_encoders])
+
+        # When the audio is run separately, the SelfRunner only handles the video and the muxing happens afterwards.
         config = RunnerConfig(
             v_encoder=self.v_encoder,
             v_lossless_encoder=self.l_encoder,
-            a_extracters=self.a_extracters,
-            a_cutters=self.a_cutters,
-            a_encoders=self.a_encoders,
-            mkv=self.muxer,
-            order=RunnerConfig.Order.VIDEO if order.lower() == 'video' else RunnerConfig.Order.AUDIO,
+            a_extracters=[] if split_audio else self.a_extracters,
+            a_cutters=[] if split_audio else self.a_cutters,
+            a_encoders=[] if split_audio else self.a_encoders,
+            mkv=None if split_audio else self.muxer,
+            order=RunnerConfig.Order.AUDIO if order.lower() == 'audio' else RunnerConfig.Order.VIDEO,
             clear_outputs=clean_up
         )
 
@@ -141,10 +223,17 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
 
         # TODO: Fix this somehow: https://github.com/Ichunjo/vardautomation/issues/106
         try:
-            runner.run()
+            if split_audio:
+                self._run_split_audio(runner, parallel_av, audio_first=order.lower() == 'audio')
+            else:
+                runner.run()
         except Exception:
             clean_up = False
             logger.warning("Some kind of error occured during the run! Disabling post clean-up...")
+            logger.warning(traceback.format_exc())
+
+        # Registered here rather than by whoever ran the audio tools, so every kind of run cleans up the same files.
+        runner.work_files.update([path for path in audio_work_files if path.exists()])
 
         if not self.file.name_file_final.exists():
             raise FileNotFoundError(f"Could not find {self.file.name_file_final}! Aborting...")
@@ -152,6 +241,77 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
         if clean_up:
             self._perform_cleanup(runner, deep_clean=deep_clean)
 
+    def _run_split_audio(self, runner: SelfRunner, /, concurrent: bool, audio_first: bool) -> None:
+        if concurrent:
+            logger.info("Encoding the video and audio concurrently...")
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                audio = executor.submit(self._run_audio_tools)
+
+                try:
+                    runner.run()
+                finally:
+                    # Always wait for the audio, so nothing is left writing files once this returns.
+                    audio_error = audio.exception()
+
+            if audio_error is not None:
+                raise audio_error
+        elif audio_first:
+            self._run_audio_tools()
+            runner.run()
+        else:
+            runner.run()
+            self._run_audio_tools()
+
+        # Everything is encoded by now, so a failing mux (e.g. a network share dropping out) is only retried by itself.
+        # Anything else, like bad track arguments, would only fail the same way again.
+        try:
+            work_files = self.muxer.mux()
+        except (OSError, subprocess.CalledProcessError):
+            logger.warning(traceback.format_exc())
+            logger.warning("Muxing failed! Retrying once...")
+            work_files = self.muxer.mux()
+
+        # The audio files are only intermediates, so they get cleaned up along with the rest of the work files.
+        if work_files:
+            runner.work_files.update(work_files)
+
+    def _run_audio_tools(self) -> None:
+        stages = self._pending_audio_tools()
+
+        # Tracks can only be passed down the pipeline if every stage still has to process all of them.
+        if not self.a_parallel and len({len(tools) for tools in stages if tools}) < 2:
+            run_audio_pipeline(*stages)
+            return
+
+        for tools in stages:
+            run_audio_tools(tools, max_workers=None if self.a_parallel else 1)
+
+    def _pending_audio_tools(self) -> Tuple[List[AudioExtracter], List[AudioCutter], List[AudioEncoder]]:
+        # Same checks as SelfRunner does before running the audio tools, so every kind of run resumes the same way.
+        # FileInfo2 extracts and cuts the audio by itself, and tools are skipped if their output already exists.
+        def _pending(tools: Sequence[Any], outputs: Callable[[Any], List[VPath]]) -> List[Any]:
+            pending = list[Any]()
+
+            for tool in tools:
+                if any(path.exists() for path in outputs(tool)):
+                    logger.warning(f'Skipping "{[path.to_str() for path in outputs(tool)]}"...')
+                else:
+                    pending.append(tool)
+
+            return pending
+
+        extracters: List[AudioExtracter] = []
+        cutters: List[AudioCutter] = []
+
+        if not isinstance(self.file, FileInfo2):
+            extracters = _pending(self.a_extracters, lambda t: [t.file.a_src.set_track(n) for n in t.track_out])
+            cutters = _pending(self.a_cutters, lambda t: [t.file.a_src_cut.set_track(t.track)])
+
+        encoders = _pending(self.a_encoders, lambda t: [t.file.a_enc_cut.set_track(t.track)])
+
+        return extracters, cutters, encoders
+
     def patch(
         self, /, ranges: FrameRangeN | List[FrameRangeN], clean_up: bool = True,
         *, external_file: os.PathLike[str] | str | None = None, output_filename: str | None = None
@@ -180,7 +340,7 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
         if external_file:
             if os.path.exists(external_file):
                 logger.info(f"Copying {external_file} to {self.file.name_file_final}")
-                shutil.copy(external_file, self.file.name_file_final)
+                _clone_file(external_file, self.file.name_file_final)
             else:
                 logger.warning(f"{self.file.name_file_final} already exists; please ensure it's the correct file!")
 
@@ -194,58 +354,59 @@ class EncodeRunner(AudioRunner, VideoRunner, ChaptersRunner):
 
         error: bool = False
 
-        try:
-            runner_object.work_files.remove(self.file.name_clip_output)
+        # Files that should be kept even though the runner considers them work files.
+        keep_files = [self.file.name_clip_output]
+
+        if self.chapters_setup and self.file.chapter:
+            keep_files.append(self.file.chapter)
 
-            if self.chapters_setup and self.file.chapter:
-                runner_object.work_files.remove(self.file.chapter)
+        try:
+            for path in keep_files:
+                if path in runner_object.work_files:
+                    runner_object.work_files.remove(path)
 
             runner_object.work_files.clear()
-        except Exception:
+        except OSError:
             error = True
 
-        try:
-            os.remove(self.file.name)
-        except FileNotFoundError:
-            pass
-
-        if self.audio_files:
-            for track in self.audio_files:
-                try:
-                    os.remove(track)
-                except FileNotFoundError:
-                    error = True
+        remove_paths: List[os.PathLike[str] | str] = [*self.audio_files, self.file.name]
 
         if deep_clean:
             logger.success("Deep cleaning enabled. Trying to clean common non-essential project files...")
 
-            for ext in common_idx_ext:
-                try:
-                    os.remove(self.file.path_without_ext / VPath(ext))
-                except FileNotFoundError:
-                    pass
+            # Index files are named after the source file (e.g. `00003.m2ts.lwi`), so list its directory just once.
+            src = self.file.path_without_ext
+
+            with suppress(FileNotFoundError), os.scandir(src.parent) as entries:
+                remove_paths += [
+                    entry.path for entry in entries
+                    if entry.name.startswith(f'{src.name}.') and entry.name.rpartition('.')[2] in common_idx_ext
+                ]
 
             if self.lossless_setup:
-                try:
-                    os.remove(self.file.name_clip_output.append_stem('_lossless').to_str())
-                except FileNotFoundError:
-                    pass
+                remove_paths.append(self.file.name_clip_output.append_stem('_lossless').to_str())
+
+        remove_errors = _remove_files(remove_paths)
+
+        # Only the audio files are guaranteed to exist, so any other file missing isn't an error.
+        if any(remove_errors[:len(self.audio_files)]) \
+                or any(e and not isinstance(e, FileNotFoundError) for e in remove_errors):
+            error = True
 
+        if deep_clean:
             try:
-                if not os.path.isdir(os.path.join(self.file.workdir, ".done")):
-                    os.mkdir(os.path.join(self.file.workdir, ".done"))
+                done_dir = VPath(self.file.workdir) / ".done"
+                done_dir.mkdir(exist_ok=True)
 
                 script_error: int = 0
 
-                try:
-                    shutil.move(str(self.file.name) + ".py", "done/" + str(self.file.name) + ".py")
-                except FileNotFoundError:
-                    script_error += 1
+                for ext in (".py", ".vpy"):
+                    script = VPath(f"{self.file.name}{ext}")
 
-                try:
-                    shutil.move(str(self.file.name) + ".vpy", "done/" + str(self.file.name) + ".vpy")
-                except FileNotFoundError:
-                    script_error += 1
+                    try:
+                        script.replace(done_dir / script.name)
+                    except FileNotFoundError:
+                        script_error += 1
 
                 if script_error > 1:
                     error = True
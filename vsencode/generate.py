@@ -23,6 +23,9 @@ __all__ = ['IniSetup']
 
 caller_name = sys.argv[0]
 
+# Default settings file for every video encoder.
+settings_templates: Dict[str, str] = {'x264': x264_defaults, 'x265': x265_defaults}
+
 
 def XmlGenerator(directory: str = '_settings') -> None:
     """Generate QAAC encoder settings."""
@@ -57,10 +60,10 @@ def _generate_settings(mode: str = 'x264', directory: str = '_settings') -> None
     if not VPath(f'{directory}/{mode}_settings').exists():
         logger.info(f"Generating sane default settings file for {mode} in {directory}...")
 
-        match mode:
-            case 'x264': settings = x264_defaults
-            case 'x265': settings = x265_defaults
-            case _: raise ValueError("_generate_settings: 'Invalid mode passed!'")
+        try:
+            settings = settings_templates[mode]
+        except KeyError:
+            raise ValueError("_generate_settings: 'Invalid mode passed!'") from None
 
         with open(f'{directory}/{mode}_settings', 'a') as f:
             f.write(settings)
@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import math
 import multiprocessing as mp
+from functools import cache
 from typing import Any, Sequence
 
 from lvsfunc.misc import source
@@ -16,12 +17,14 @@ __all__ = [
     'FileInfo',
     'get_encoder_cores',
     'get_lookahead',
+    'get_prefetch',
     'get_sar',
     'verify_file_exists',
     'get_range',
 ]
 
 
+@cache
 def get_encoder_cores() -> int:
     """Return the amount of cores to auto-relocate to the encoder."""
     return math.ceil(mp.cpu_count() * 0.4)
@@ -37,13 +40,33 @@ def get_lookahead(clip: vs.VideoNode, ceil: int = 72) -> int:
     return min([clip.fps.numerator * 5, ceil])
 
 
-def get_sar(clip: vs.VideoNode) -> tuple[int, int]:
-    """Return the SAR from the clip."""
+def get_prefetch(clip: vs.VideoNode, cache_share: float = 0.5) -> int:
+    """
+    Return the amount of frames to prefetch that keeps memory usage in check.
+
+    Every prefetched frame is held in memory until the encoder takes it,
+    so this is capped to what fits in a share of VapourSynth's cache.
+    There's no use requesting more frames at once than VapourSynth has threads to render them either.
+    """
+    assert clip.format
+
+    fmt = clip.format
+    chroma_planes = fmt.num_planes - 1
+    frame_size = clip.width * clip.height * fmt.bytes_per_sample \
+        * (1 + chroma_planes / (1 << (fmt.subsampling_w + fmt.subsampling_h)))
+
+    budget = clip.core.max_cache_size * 1024 ** 2 * cache_share
+
+    return max(1, min(clip.core.num_threads, int(budget // frame_size)))
+
+
+def get_sar(clip: vs.VideoNode | vs.FrameProps) -> tuple[int, int]:
+    """Return the SAR from the clip or the given frame props."""
     return get_prop(clip, "_SARDen", int), get_prop(clip, "_SARNum", int)
 
 
-def get_range(clip: vs.VideoNode) -> int:
-    """Return the color range from the clip."""
+def get_range(clip: vs.VideoNode | vs.FrameProps) -> int:
+    """Return the color range from the clip or the given frame props."""
     # TODO: Double-check ranges for x264 match those of x265. See `get_color_range` also. Convert to enum instead?
     return int(not bool(get_prop(clip, "_ColorRange", int)))
 
@@ -85,7 +108,7 @@ def FileInfo(path: AnyPath, trims: list[Trim | DuplicateFrame] | Trim | None = N
     return FileInfo2(path, trims_or_dfs=trims, idx=idx, preset=preset, workdir=workdir)
 
 
-def get_color_range(clip: vs.VideoNode, params: list[str]) -> tuple[int, int]:
+def get_color_range(clip: vs.VideoNode, params: list[str], props: vs.FrameProps | None = None) -> tuple[int, int]:
     """
     Get the luma colour range specified in the params.
     Fallback to the clip properties.
@@ -94,11 +117,15 @@ def get_color_range(clip: vs.VideoNode, params: list[str]) -> tuple[int, int]:
 
     :param params:              Settings of the encoder.
     :param clip:                Source
+    :param props:               Frame props of the source's first frame, if already retrieved.
     :return:                    A tuple of min_luma and max_luma value
     """
     bits = get_depth(clip)
 
     def _get_props(clip: vs.VideoNode) -> dict[str, Any]:
+        if props is not None:
+            return dict(props)
+
         with clip.get_frame(0) as frame:
             return frame.props.copy()
 
@@ -109,7 +136,7 @@ def get_color_range(clip: vs.VideoNode, params: list[str]) -> tuple[int, int]:
 
         # TODO: Rewrite to use enums
         if rng_param == '{range:d}':
-            rng_param = int(get_range(clip))  # type:ignore
+            rng_param = int(get_range(clip if props is None else props))  # type:ignore
 
             try:
                 rng_param = rng_map[rng_param]
@@ -1,16 +1,19 @@
 from __future__ import annotations
 
+import os
+from contextlib import suppress
 from copy import copy as shallow_copy
 from fractions import Fraction
-from typing import TYPE_CHECKING, Any, Dict, List, Type, cast
+from itertools import chain, repeat
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Type, cast
 
-from vardautomation import (AudioCutter, AudioEncoder, AudioExtracter, AudioTrack, DuplicateFrame, FDKAACEncoder,
-                            FlacEncoder, OpusEncoder, PassthroughAudioEncoder, QAACEncoder, Trim, VPath, logger)
+from vardautomation import (JAPANESE, AudioCutter, AudioEncoder, AudioExtracter, AudioTrack, DuplicateFrame,
+                            FDKAACEncoder, FileInfo2, FlacEncoder, Lang, OpusEncoder, PassthroughAudioEncoder,
+                            QAACEncoder, Trim, VPath, logger)
 from vstools import vs
 
-from ..audio import (check_aac_encoders_installed, get_track_info, iterate_ap_audio_files, iterate_cutter,
-                     iterate_encoder, iterate_extractors, iterate_tracks, run_ap, set_eafile_properties,
-                     set_missing_tracks)
+from ..audio import (_get_media_info, check_aac_encoders_installed, get_track_info, iterate_ap_audio_files,
+                     iterate_audio_setup, iterate_encoder, run_ap, set_eafile_properties, set_missing_tracks)
 from ..generate import XmlGenerator
 from ..types import AUDIO_CODEC
 from .base import BaseRunner, SetupStep
@@ -25,17 +28,38 @@ __all__ = ['AudioRunner']
 # These codecs get re-encoded/errored out by all the extracters, making a simple passthrough impossible.
 reenc_codecs = ['AC-3', 'EAC-3']
 
+# Encoder classes for every supported audio codec. New encoders can be registered here.
+audio_encoders: Dict[str, Type[AudioEncoder]] = {
+    'passthrough': PassthroughAudioEncoder,
+    'aac': QAACEncoder,
+    'qaac': QAACEncoder,
+    'flac': FlacEncoder,
+    'opus': OpusEncoder,
+    'fdkaac': FDKAACEncoder,
+}
+
 
 class AudioRunner(BaseRunner):
     """Generate AudioRunner object."""
 
-    a_extracters = list[AudioExtracter]()
-    a_cutters = list[AudioCutter]()
-    a_encoders = list[AudioEncoder]()
-    a_tracks = list[AudioTrack]()
+    a_extracters: List[AudioExtracter]
+    a_cutters: List[AudioCutter]
+    a_encoders: List[AudioEncoder]
+    a_tracks: List[AudioTrack]
+    a_work_files: List[VPath]
+    a_parallel: bool = False
 
     # Audio-related vars
-    audio_files = list[str]()
+    audio_files: List[str]
+
+    def __init__(self, file: FileInfo2, clip: vs.VideoNode, lang: Lang | Iterable[Lang] = JAPANESE) -> None:
+        super().__init__(file, clip, lang)
+
+        # Set per instance, so multiple runners never end up sharing (and appending to) the same lists.
+        self.a_extracters, self.a_cutters, self.a_encoders = [], [], []
+        self.a_tracks = []
+        self.a_work_files = []
+        self.audio_files = []
 
     def audio(
         self,
@@ -48,6 +72,7 @@ class AudioRunner(BaseRunner):
         cutter_overrides: Dict[str, Any] = {},
         extract_overrides: Dict[str, Any] = {},
         encoder_overrides: Dict[str, Any] = {},
+        parallel: bool = False,
     ) -> EncodeRunner:
         """
         Set up the relevant settings for the audio.
@@ -76,6 +101,8 @@ class AudioRunner(BaseRunner):
         :param extract_overrides:       Overrides for Eac3toAudioExtracter's extracting.
         :param encoder_overrides:       Overrides for the encoder settings.
         :param track_overrides:         Overrides for the audio track settings.
+        :param parallel:                Extract, cut and encode every track at the same time during `run`,
+                                        instead of one after another. Does nothing if AudioProcessor is used.
         """
         self.check_in_chain(SetupStep.AUDIO)
         logger.success("Checking audio related settings...")
@@ -91,13 +118,11 @@ class AudioRunner(BaseRunner):
             XmlGenerator()
             xml_file = "_settings/tags_aac.xml"
 
-        track_count: int = 0
-
         audio_langs = self.a_lang.copy()
 
         if hasattr(self.file, "audios"):
             if len(audio_langs) < len(self.file.audios):
-                audio_langs += [audio_langs[-1]] * (len(self.file.audios) - len(audio_langs))
+                audio_langs.extend([audio_langs[-1]] * (len(self.file.audios) - len(audio_langs)))
 
         ea_file = external_audio_file
 
@@ -117,14 +142,15 @@ class AudioRunner(BaseRunner):
         if ea_file:
             file_copy = set_eafile_properties(file_copy, ea_file, external_audio_clip, trims, use_ap)
 
+        # Only parse the source once, for both the track count and the track info.
+        media_info = _get_media_info(ea_file or file_copy.path.to_str())
+
         try:
             track_count = len(file_copy.audios)
         except AttributeError:
-            for media_track in file_copy.media_info.tracks:
-                if media_track.track_type == 'Audio':
-                    track_count += 1
+            track_count = sum(media_track.track_type == 'Audio' for media_track in media_info.tracks)
 
-        track_channels, original_codecs = get_track_info(ea_file or file_copy, all_tracks)
+        track_channels, original_codecs = get_track_info(ea_file or file_copy, all_tracks, media_info)
 
         if enc == 'passthrough' and any(c in original_codecs for c in reenc_codecs):
             logger.warning(
@@ -149,46 +175,57 @@ class AudioRunner(BaseRunner):
             )
         else:
             if hasattr(self.file, "audios"):
+                # List the directory once, rather than checking whether every track's file exists separately.
+                existing = set[str]()
+
+                if file_copy.a_src_cut:
+                    with suppress(FileNotFoundError), os.scandir(file_copy.a_src_cut.parent) as entries:
+                        existing = {entry.name for entry in entries}
+
                 for i, _ in enumerate(file_copy.audios):
                     if not file_copy.a_src_cut or not file_copy.a_enc_cut:
                         continue
 
-                    if not VPath(file_copy.a_src_cut.to_str().format(track_number=str(i))).exists():
+                    if VPath(file_copy.a_src_cut.to_str().format(track_number=str(i))).name not in existing:
                         file_copy.write_a_src_cut(index=i)
 
-                    self.a_tracks += [
+                    self.a_tracks.append(
                         AudioTrack(file_copy.a_enc_cut.format(track_number=str(i)), original_codecs[i],
                                    audio_langs[i], i)
-                    ]
+                    )
 
                     if not all_tracks:
                         break
             else:
-                self.a_extracters = iterate_extractors(file_copy, tracks=track_count, **extract_overrides)
-                self.a_cutters = iterate_cutter(file_copy, tracks=track_count, **cutter_overrides)
-                self.a_tracks = iterate_tracks(file_copy, track_count, None, original_codecs)
-
-            aencoder: Type[AudioEncoder]
-
-            match enc:
-                case 'passthrough': aencoder = PassthroughAudioEncoder
-                case 'aac' | 'qaac': aencoder = QAACEncoder
-                case 'flac': aencoder = FlacEncoder
-                case 'opus': aencoder = OpusEncoder
-                case 'fdkaac': aencoder = FDKAACEncoder
-                case _: raise ValueError(
-                    f"'\"{encoder}\" is not a valid audio encoder! Please see the docstring for valid encoders.'"
+                self.a_extracters, self.a_cutters, self.a_tracks = iterate_audio_setup(
+                    file_copy, track_count, original_codecs,
+                    extract_overrides=extract_overrides, cutter_overrides=cutter_overrides
                 )
 
+            try:
+                aencoder = audio_encoders[enc]
+            except KeyError:
+                raise ValueError(
+                    f"'\"{encoder}\" is not a valid audio encoder! Please see the docstring for valid encoders.'"
+                ) from None
+
             self.a_encoders = iterate_encoder(file_copy, aencoder, tracks=track_count, **encoder_overrides)
 
+            # Every file the tools may write for a track, so the run can clean up the intermediates.
+            fmt_args = {'work_filename': file_copy.work_filename}
+            self.a_work_files = [
+                VPath(path.to_str().format_map(fmt_args | {'track_number': str(i)}))
+                for path in (file_copy.a_src, file_copy.a_src_cut, file_copy.a_enc_cut) if path
+                for i in range(track_count)
+            ]
+
         del file_copy
 
         lang_tracks = list[AudioTrack]()
 
-        for track, lang in zip(self.a_tracks, self.a_lang):
+        for track, lang in zip(self.a_tracks, chain(self.a_lang, repeat(self.a_lang[-1]))):
             track.lang = lang
-            lang_tracks += [track]
+            lang_tracks.append(track)
 
         logger.info(f"Setting audio tracks' languages...\nOld: {self.a_tracks}\nNew: {lang_tracks}")
         self.a_tracks = lang_tracks
@@ -211,6 +248,8 @@ class AudioRunner(BaseRunner):
                 f"New order: {_format_tracks(self.a_tracks)}"
             )
 
+        self.a_parallel = parallel
         self.audio_setup = True
+        self.setup_steps[SetupStep.AUDIO] = True
 
         return cast(EncodeRunner, self)
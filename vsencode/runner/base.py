@@ -1,10 +1,10 @@
 from enum import Enum
-from typing import List
+from typing import Dict, Iterable, List
 
 from vardautomation import JAPANESE, FileInfo2, Lang, logger
 from vstools import check_variable, vs
 
-from ..exceptions import AlreadyInChainError, NotEnoughValuesError
+from ..exceptions import AlreadyInChainError, NotEnoughValuesError, NotInChainError
 from ..generate import IniSetup
 
 __all__ = ['BaseRunner', 'SetupStep']
@@ -32,16 +32,17 @@ class BaseRunner:
     a_lang: List[Lang]
     c_lang: Lang
 
+    # Whether every step has been set up for this runner.
+    video_setup: bool = False
+    lossless_setup: bool = False
+    audio_setup: bool = False
+    chapters_setup: bool = False
+    muxing_setup: bool = False
+
     # Keeping track of the steps done...
-    setup_steps = dict[SetupStep, bool]({
-        SetupStep.VIDEO: False,
-        SetupStep.LOSSLESS: False,
-        SetupStep.AUDIO: False,
-        SetupStep.CHAPTERS: False,
-        SetupStep.MUXING: False
-    })
-
-    def __init__(self, file: FileInfo2, clip: vs.VideoNode, lang: Lang | List[Lang] = JAPANESE) -> None:
+    setup_steps: Dict[SetupStep, bool]
+
+    def __init__(self, file: FileInfo2, clip: vs.VideoNode, lang: Lang | Iterable[Lang] = JAPANESE) -> None:
         logger.success(f"Initializing vardautomation environent for {file.name}...")
 
         check_variable(clip, 'EncodeRunner')
@@ -49,18 +50,32 @@ class BaseRunner:
         self.file = file
         self.clip = clip
 
+        # Set per instance, so one runner's steps never count towards another runner's chain.
+        self.setup_steps = dict.fromkeys(SetupStep, False)
+
         if isinstance(lang, Lang):
             self.v_lang, self.a_lang, self.c_lang = lang, [lang], lang
-        elif len(lang) == 2:
-            self.v_lang, self.a_lang, self.c_lang = lang[0], lang[1:], lang[0]
-        elif len(lang) >= 3:
-            self.v_lang, self.a_lang, self.c_lang = lang[0], lang[1:-1], lang[-1]
         else:
-            raise NotEnoughValuesError(f"You must give a list of at least three (3) languages! Not {len(lang)}!'")
+            # Materialize once, so any iterable of languages works and is only walked a single time.
+            langs = tuple(lang)
+
+            if len(langs) == 2:
+                self.v_lang, self.a_lang, self.c_lang = langs[0], [langs[1]], langs[0]
+            elif len(langs) >= 3:
+                self.v_lang, *self.a_lang, self.c_lang = langs
+            else:
+                raise NotEnoughValuesError(f"You must give a list of at least three (3) languages! Not {len(langs)}!'")
 
         self.file.name_file_final = IniSetup().parse_name()
 
     def check_in_chain(self, step: SetupStep, verify: bool = False) -> None:
-        """Check whether step has already been run in the current chain."""
-        if self.setup_steps[step] and not verify:
+        """
+        Check whether step has already been run in the current chain.
+
+        If `verify` is set, check that the step has been run before instead.
+        """
+        if verify:
+            if not self.setup_steps[step]:
+                raise NotInChainError(step.value)
+        elif self.setup_steps[step]:
             raise AlreadyInChainError(step.value)
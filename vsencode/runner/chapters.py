@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, List, Sequence, cast
+from typing import TYPE_CHECKING, Any, Iterable, List, Sequence, cast
 
-from vardautomation import Chapter, ChaptersTrack, MatroskaXMLChapters, logger
+from vardautomation import JAPANESE, Chapter, ChaptersTrack, FileInfo2, Lang, MatroskaXMLChapters, logger
+from vstools import vs
 
 from .base import BaseRunner, SetupStep
 
@@ -17,7 +18,12 @@ __all__ = ['ChaptersRunner']
 class ChaptersRunner(BaseRunner):
     """Generate ChaptersRunner object."""
 
-    c_tracks = list[ChaptersTrack]()
+    c_tracks: List[ChaptersTrack]
+
+    def __init__(self, file: FileInfo2, clip: vs.VideoNode, lang: Lang | Iterable[Lang] = JAPANESE) -> None:
+        super().__init__(file, clip, lang)
+
+        self.c_tracks = []
 
     def chapters(
         self, chapter_list: List[Chapter], chapter_offset: int | None = None, chapter_names: Sequence[str] | None = None
@@ -35,17 +41,20 @@ class ChaptersRunner(BaseRunner):
         assert self.file.chapter
         assert self.file.trims_or_dfs
 
+        fps = self.file.clip.fps
+
         chapxml = MatroskaXMLChapters(self.file.chapter)
-        chapxml.create(chapter_list, self.file.clip.fps)
+        chapxml.create(chapter_list, fps)
 
         if chapter_offset:
-            chapxml.shift_times(chapter_offset, self.file.clip.fps)
+            chapxml.shift_times(chapter_offset, fps)
 
         if chapter_names:
             chapxml.set_names(chapter_names)
 
-        self.c_tracks += [ChaptersTrack(chapxml.chapter_file, self.c_lang)]
+        self.c_tracks.append(ChaptersTrack(chapxml.chapter_file, self.c_lang))
 
         self.chapters_setup = True
+        self.setup_steps[SetupStep.CHAPTERS] = True
 
         return cast(EncodeRunner, self)
@@ -8,7 +8,7 @@ from vstools import vs
 
 from ..exceptions import NoLosslessVideoEncoderError, NoVideoEncoderError
 from ..generate import VEncSettingsGenerator
-from ..helpers import get_lookahead, verify_file_exists
+from ..helpers import get_lookahead, get_prefetch, verify_file_exists
 from ..types import LOSSLESS_VIDEO_ENCODER, VIDEO_CODEC
 from ..video import finalize_clip, get_lossless_video_encoder, get_video_encoder, validate_qp_clip
 from .base import BaseRunner, SetupStep
@@ -36,6 +36,7 @@ class VideoRunner(BaseRunner):
         self, encoder: VIDEO_CODEC = 'x265', settings: str | bool | None = None,
         zones: Dict[Tuple[int, int], Dict[str, Any]] | None = None,
         qp_clip: vs.VideoNode | bool | None = None, prefetch: int | None = None,
+        workers: int = 1, chunk_size: int | None = None,
         **enc_overrides: Any
     ) -> EncodeRunner:
         """
@@ -56,7 +57,14 @@ class VideoRunner(BaseRunner):
                                     If None, uses base cut clip. If False, disables qp_clip injection.
         :param prefetch:            Prefetch. Set a low value to limit the number of frames rendered at once.
                                     This should not be set higher than your keyint in the encoding settings.
-                                    Default is input clip's framerate * 10.
+                                    Default is derived from the lookahead or keyint in the encoding settings.
+                                    If neither is set, picks a value that fits in VapourSynth's cache.
+        :param workers:             Split the clip into this many chunks and encode them all at once.
+                                    Every chunk gets an even share of the encoder threads.
+                                    Can't be combined with zones. Default: 1.
+        :param chunk_size:          Maximum length of a chunk in frames when `workers` > 1.
+                                    Splitting long encodes into more, shorter chunks keeps every encoder busy
+                                    until the very end. If None, the clip is split into `workers` chunks.
         :param enc_overrides:       Overrides for the encoder settings.
         """
         self.check_in_chain(SetupStep.VIDEO)
@@ -65,6 +73,10 @@ class VideoRunner(BaseRunner):
         if not any(encoder.lower() == x for x in ['x264', 'x265', 'h265', 'h264']):
             raise NoVideoEncoderError("Invalid video encoder given!")
 
+        if zones and workers > 1:
+            logger.warning("video: Zones can't be applied to chunked encodes. Encoding in a single chunk instead...")
+            workers = 1
+
         if zones:
             norm_zones = dict[Tuple[int, int], dict[str, Any]]()
 
@@ -72,25 +84,24 @@ class VideoRunner(BaseRunner):
                 zone = (zone[0] or 0, zone[1] or self.clip.num_frames-1)
                 norm_zones |= {zone: setting}
 
-            zones = dict(sorted(norm_zones.items()))
+            zones = dict(sorted(norm_zones.items(), key=lambda item: item[0]))
 
         if settings is None:
-            if verify_file_exists(f"_settings/{encoder}_settings"):
-                settings = f"_settings/{encoder}_settings"
-            else:
+            mode = 'x264' if encoder.lower() in ('x264', 'h264') else 'x265'
+            settings = f"_settings/{mode}_settings"
+
+            # Only probe for the settings file once; the generator only needs to run when it's missing.
+            if not verify_file_exists(settings):
                 logger.warning(
                     "video: No settings file found. We will automatically generate one for you using sane defaults. "
                     f"To disable this behaviour and use default {encoder} settings, set `settings=False`."
                 )
-
-            match encoder:
-                case 'x264' | 'h264': VEncSettingsGenerator(encoder)
-                case 'x265' | 'h265': VEncSettingsGenerator(encoder)
+                VEncSettingsGenerator(mode)
 
         self.clip = finalize_clip(self.clip)
 
         if isinstance(encoder, (str, VideoLanEncoder)):
-            self.v_encoder = get_video_encoder(encoder, settings, zones=zones, **enc_overrides)
+            self.v_encoder = get_video_encoder(encoder, settings, workers, chunk_size, zones=zones, **enc_overrides)
         else:
             raise NoVideoEncoderError
 
@@ -102,12 +113,13 @@ class VideoRunner(BaseRunner):
                 # I feel that there are better ways to do these, I'm just dumb
                 elif "--rc-lookahead" in fr:
                     match = re.search(r"--rc-lookahead \d+", fr)
-                    prefetch = int(re.sub(r"[^\d+]", '', match.group(0))) if match else 0
+                    prefetch = int(re.sub(r"[^\d+]", '', match.group(0))) if match else None
                 elif "--keyint" in fr:
                     match = re.search(r"--keyint \d+", fr)
-                    prefetch = int(re.sub(r"[^\d+]", '', match.group(0))) if match else 0
+                    prefetch = int(re.sub(r"[^\d+]", '', match.group(0))) if match else None
 
-        self.v_encoder.prefetch = prefetch or 0
+        # Without a prefetch, VapourSynth renders as many frames as it can at once and can easily run out of memory.
+        self.v_encoder.prefetch = get_prefetch(self.clip) if prefetch is None else prefetch
         self.v_encoder.resumable = True
 
         logger.info(f"Encoding video using {encoder}.")
@@ -121,6 +133,7 @@ class VideoRunner(BaseRunner):
             logger.info("qp_clip set using the original clip cut as qp clip.")
 
         self.video_setup = True
+        self.setup_steps[SetupStep.VIDEO] = True
 
         return cast(EncodeRunner, self)
 
@@ -175,5 +188,6 @@ class VideoRunner(BaseRunner):
         logger.info(f"Creating an intermediary lossless encode using {encoder}.")
 
         self.lossless_setup = True
+        self.setup_steps[SetupStep.LOSSLESS] = True
 
         return cast(EncodeRunner, self)
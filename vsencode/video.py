@@ -1,20 +1,29 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Tuple, Type
 
 from vardautomation import FFV1, LosslessEncoder, NVEncCLossless, VideoLanEncoder
 from vstools import finalize_clip, vs
 
-from .codecs import X264Custom, X265Custom
+from .codecs import ChunkedEncoder, X264Chunked, X264Custom, X265Chunked, X265Custom
 from .exceptions import FrameLengthMismatch, NoVideoEncoderError
 from .helpers import get_encoder_cores, verify_file_exists
 from .types import LOSSLESS_VIDEO_ENCODER, VIDEO_CODEC
 
+# Regular and chunked encoder classes for every supported video codec.
+video_encoders: Dict[str, Tuple[Type[VideoLanEncoder], Type[ChunkedEncoder]]] = {
+    'x264': (X264Custom, X264Chunked),
+    'h264': (X264Custom, X264Chunked),
+    'x265': (X265Custom, X265Chunked),
+    'h265': (X265Custom, X265Chunked),
+}
+
 
 def get_video_encoder(
-    v_encoder: VIDEO_CODEC, settings: str | bool | None = None, **kwargs: Any
+    v_encoder: VIDEO_CODEC, settings: str | bool | None = None,
+    workers: int = 1, chunk_size: int | None = None, **kwargs: Any
 ) -> VideoLanEncoder:
-    """Retrieve the video encoder to use."""
+    """Retrieve the video encoder to use. If `workers` > 1, returns an encoder that encodes multiple chunks at once."""
     if settings is True or not settings:
         raise NotImplementedError
         #  VEncSettingsSetup(v_encoder)
@@ -25,10 +34,18 @@ def get_video_encoder(
     if not verify_file_exists(settings):
         raise FileNotFoundError(f"Settings file not found at {settings}!")
 
-    match v_encoder.lower():
-        case 'x264' | 'h264': return X264Custom(settings, **kwargs)
-        case 'x265' | 'h265': return X265Custom(settings, **kwargs)
-        case _: raise NoVideoEncoderError
+    try:
+        single, chunked = video_encoders[v_encoder.lower()]
+    except KeyError:
+        raise NoVideoEncoderError from None
+
+    encoder = (chunked if workers > 1 else single)(settings, **kwargs)
+
+    if isinstance(encoder, ChunkedEncoder):
+        encoder.workers = workers
+        encoder.chunk_size = chunk_size
+
+    return encoder
 
 
 def get_lossless_video_encoder(
@@ -49,6 +66,9 @@ def get_lossless_video_encoder(
 
 def validate_qp_clip(clip: vs.VideoNode, qp_clip: vs.VideoNode) -> vs.VideoNode:
     """Validate whether the qp clip matches the base clip."""
+    if qp_clip is clip:
+        return qp_clip
+
     len_a, len_b = len(clip), len(qp_clip)
 
     if len_a != len_b: